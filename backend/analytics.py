@@ -0,0 +1,257 @@
+# backend/analytics.py
+"""
+Attendance rollups and the aggregate queries served from them.
+
+When a session ends, `refresh_session_rollup` stores its headcount in
+session_rollups and recomputes student_subject_rollups for the students
+who attended it (one GROUP BY over their records in that subject). The
+dashboard queries below only read these two tables (plus enrollments and
+subjects), so their cost depends on the number of sessions and students,
+not on the number of raw attendance records.
+
+Sessions that only expired by end_time (never ended through the API) are
+picked up by `rebuild_rollups`, run by migration 0005 and by
+`python -m backend.scripts.refresh_rollups`.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .models import (
+    AttendanceRecord, ClassSession, CourseEnrollment, SessionRollup, StudentSubjectRollup,
+    Subject, User,
+)
+
+
+def percentage(part, whole):
+    return round(100.0 * part / whole, 1) if whole else None
+
+
+# ---------- Refresh ----------
+
+def _session_rows(*criteria):
+    enrolled = (
+        select(func.count(CourseEnrollment.id))
+        .where(CourseEnrollment.subject_id == ClassSession.subject_id)
+        .scalar_subquery()
+    )
+    present = (
+        select(func.count(AttendanceRecord.id))
+        .where(AttendanceRecord.session_id == ClassSession.id)
+        .scalar_subquery()
+    )
+    late = (
+        select(func.count(AttendanceRecord.id))
+        .where(AttendanceRecord.session_id == ClassSession.id, AttendanceRecord.status == "LATE")
+        .scalar_subquery()
+    )
+    return select(
+        ClassSession.id, ClassSession.subject_id, ClassSession.start_time, enrolled, present, late
+    ).where(*criteria)
+
+
+def _student_rows(*criteria):
+    return (
+        select(
+            AttendanceRecord.student_id,
+            SessionRollup.subject_id,
+            func.count(AttendanceRecord.id),
+            func.count(AttendanceRecord.id).filter(AttendanceRecord.status == "LATE"),
+            func.max(AttendanceRecord.timestamp),
+        )
+        .join(SessionRollup, SessionRollup.session_id == AttendanceRecord.session_id)
+        .where(SessionRollup.subject_id.isnot(None), *criteria)
+        .group_by(AttendanceRecord.student_id, SessionRollup.subject_id)
+    )
+
+
+def _upsert_sessions(db, rows):
+    stmt = pg_insert(SessionRollup).from_select(
+        ["session_id", "subject_id", "start_time", "enrolled", "present", "late"], rows
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[SessionRollup.session_id],
+        set_={
+            "subject_id": stmt.excluded.subject_id,
+            "start_time": stmt.excluded.start_time,
+            "enrolled": stmt.excluded.enrolled,
+            "present": stmt.excluded.present,
+            "late": stmt.excluded.late,
+            "refreshed_at": func.now(),
+        },
+    ))
+
+
+def _upsert_students(db, rows):
+    stmt = pg_insert(StudentSubjectRollup).from_select(
+        ["student_id", "subject_id", "attended", "late", "last_attended"], rows
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[StudentSubjectRollup.student_id, StudentSubjectRollup.subject_id],
+        set_={
+            "attended": stmt.excluded.attended,
+            "late": stmt.excluded.late,
+            "last_attended": stmt.excluded.last_attended,
+            "refreshed_at": func.now(),
+        },
+    ))
+
+
+def refresh_session_rollup(db, session):
+    """Roll up one (ended) session and its students' subject totals. Does not commit."""
+    _upsert_sessions(db, _session_rows(ClassSession.id == session.id))
+    if session.subject_id is None:
+        return
+    attendees = select(AttendanceRecord.student_id).where(AttendanceRecord.session_id == session.id)
+    _upsert_students(db, _student_rows(
+        SessionRollup.subject_id == session.subject_id,
+        AttendanceRecord.student_id.in_(attendees),
+    ))
+
+
+def rebuild_rollups(db) -> int:
+    """
+    Recompute every rollup from the raw records for all sessions that have
+    ended (flag cleared or end_time passed). Commits; returns the number
+    of sessions rolled up.
+    """
+    now = datetime.now(timezone.utc)
+    db.query(StudentSubjectRollup).delete()
+    db.query(SessionRollup).delete()
+    _upsert_sessions(db, _session_rows(or_(ClassSession.is_active == False, ClassSession.end_time <= now)))  # noqa: E712
+    _upsert_students(db, _student_rows())
+    db.commit()
+    return db.query(func.count(SessionRollup.session_id)).scalar()
+
+
+# ---------- Queries ----------
+
+def student_subject_stats(db, student_id=None, subject_id=None):
+    """Per (enrolled student, subject): sessions held, attended, late and percentage."""
+    held = (
+        select(SessionRollup.subject_id, func.count().label("held"))
+        .group_by(SessionRollup.subject_id)
+        .subquery()
+    )
+    q = (
+        select(
+            CourseEnrollment.user_id, User.enrollment_no, User.full_name,
+            CourseEnrollment.subject_id, Subject.code, Subject.name,
+            func.coalesce(held.c.held, 0),
+            func.coalesce(StudentSubjectRollup.attended, 0),
+            func.coalesce(StudentSubjectRollup.late, 0),
+            StudentSubjectRollup.last_attended,
+        )
+        .join(User, User.id == CourseEnrollment.user_id)
+        .join(Subject, Subject.id == CourseEnrollment.subject_id)
+        .outerjoin(held, held.c.subject_id == CourseEnrollment.subject_id)
+        .outerjoin(StudentSubjectRollup, and_(
+            StudentSubjectRollup.student_id == CourseEnrollment.user_id,
+            StudentSubjectRollup.subject_id == CourseEnrollment.subject_id,
+        ))
+        .order_by(Subject.code, User.enrollment_no)
+    )
+    if student_id is not None:
+        q = q.where(CourseEnrollment.user_id == student_id)
+    if subject_id is not None:
+        q = q.where(CourseEnrollment.subject_id == subject_id)
+    return [
+        {
+            "student_id": str(sid),
+            "enrollment_no": enrollment_no,
+            "full_name": full_name,
+            "subject_id": str(subj),
+            "subject_code": code,
+            "subject_name": name,
+            "sessions_held": held_n,
+            "attended": attended,
+            "late": late,
+            "percentage": percentage(attended, held_n),
+            "last_attended": last,
+        }
+        for sid, enrollment_no, full_name, subj, code, name, held_n, attended, late, last in db.execute(q)
+    ]
+
+
+def _session_stats(row):
+    session_id, subject_id, start_time, enrolled, present, late = row
+    return {
+        "session_id": str(session_id),
+        "subject_id": str(subject_id) if subject_id else None,
+        "start_time": start_time,
+        "enrolled": enrolled,
+        "present": present,
+        "late": late,
+        "absent": max(0, enrolled - present),
+        "percentage": percentage(present, enrolled),
+    }
+
+
+def session_stats(db, subject_id=None, since=None, until=None, limit=500):
+    """Headcount of rolled-up sessions, newest first."""
+    q = select(
+        SessionRollup.session_id, SessionRollup.subject_id, SessionRollup.start_time,
+        SessionRollup.enrolled, SessionRollup.present, SessionRollup.late,
+    )
+    if subject_id is not None:
+        q = q.where(SessionRollup.subject_id == subject_id)
+    if since is not None:
+        q = q.where(SessionRollup.start_time >= since)
+    if until is not None:
+        q = q.where(SessionRollup.start_time < until)
+    rows = db.execute(q.order_by(SessionRollup.start_time.desc()).limit(limit))
+    return [_session_stats(r) for r in rows]
+
+
+def live_session_stats(db, session):
+    """Headcount of one session: its rollup once ended, else counted live."""
+    row = db.execute(
+        select(
+            SessionRollup.session_id, SessionRollup.subject_id, SessionRollup.start_time,
+            SessionRollup.enrolled, SessionRollup.present, SessionRollup.late,
+        ).where(SessionRollup.session_id == session.id)
+    ).first()
+    rolled_up = row is not None
+    if not rolled_up:
+        row = db.execute(_session_rows(ClassSession.id == session.id)).one()
+    return {**_session_stats(row), "rolled_up": rolled_up}
+
+
+def subject_stats(db, subject_id=None, since=None, until=None):
+    """Per subject over a date range: sessions, headcount totals and average attendance."""
+    q = (
+        select(
+            SessionRollup.subject_id, Subject.code, Subject.name,
+            func.count(SessionRollup.session_id),
+            func.sum(SessionRollup.present),
+            func.sum(SessionRollup.late),
+            func.sum(SessionRollup.enrolled),
+            func.min(SessionRollup.start_time),
+            func.max(SessionRollup.start_time),
+        )
+        .join(Subject, Subject.id == SessionRollup.subject_id)
+        .group_by(SessionRollup.subject_id, Subject.code, Subject.name)
+        .order_by(Subject.code)
+    )
+    if subject_id is not None:
+        q = q.where(SessionRollup.subject_id == subject_id)
+    if since is not None:
+        q = q.where(SessionRollup.start_time >= since)
+    if until is not None:
+        q = q.where(SessionRollup.start_time < until)
+    return [
+        {
+            "subject_id": str(subj),
+            "subject_code": code,
+            "subject_name": name,
+            "sessions": sessions,
+            "present": int(present or 0),
+            "late": int(late or 0),
+            # over all sessions: records / enrolled seats
+            "percentage": percentage(int(present or 0), int(seats or 0)),
+            "first_session": first,
+            "last_session": last,
+        }
+        for subj, code, name, sessions, present, late, seats, first, last in db.execute(q)
+    ]
@@ -0,0 +1,201 @@
+# backend/attendance_writer.py
+"""
+Write path for kiosk attendance records.
+
+attendance_records is unique on (session_id, student_id), and every
+insert is `INSERT ... ON CONFLICT DO NOTHING`, so concurrent frames of the
+same student can never create two rows. With ATTENDANCE_FLUSH_MS > 0
+records are buffered in memory and flushed in one statement every N ms
+(or when ATTENDANCE_BUFFER_MAX rows are waiting) instead of one INSERT +
+commit per match; the session galleries' in-memory marked sets keep the
+kiosk responses consistent in the meantime.
+
+A batch the database rejects (a constraint violation or a bad value) is
+split and written row by row; only the offending rows are dropped, and
+logged. Rows of a flush that failed for any other reason stay buffered
+and are retried on the next tick, up to ATTENDANCE_FLUSH_RETRIES times.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from . import config
+from .db import SessionLocal
+from .models import AttendanceRecord
+
+logger = logging.getLogger(__name__)
+
+UNIQUE_CONSTRAINT = "uq_attendance_session_student"
+
+
+def attendance_row(session_id, student_id, score, image_path, status="PRESENT"):
+    return {
+        "id": uuid.uuid4(),
+        "session_id": session_id,
+        "student_id": student_id,
+        "status": status,
+        "confidence": str(score),
+        "image_path": image_path,
+    }
+
+
+def insert_attendance(db, rows) -> set:
+    """
+    Insert attendance rows, skipping (session, student) pairs that already
+    exist. Returns the student_ids actually inserted. Does not commit.
+    """
+    if not rows:
+        return set()
+    stmt = (
+        pg_insert(AttendanceRecord)
+        .values(rows)
+        .on_conflict_do_nothing(constraint=UNIQUE_CONSTRAINT)
+        .returning(AttendanceRecord.student_id)
+    )
+    return {student_id for (student_id,) in db.execute(stmt)}
+
+
+class AttendanceBuffer:
+    def __init__(self, flush_ms=None, max_rows=None, max_retries=None):
+        self.flush_ms = config.ATTENDANCE_FLUSH_MS if flush_ms is None else flush_ms
+        self.max_rows = max_rows or config.ATTENDANCE_BUFFER_MAX
+        self.max_retries = config.ATTENDANCE_FLUSH_RETRIES if max_retries is None else max_retries
+        self._rows = []
+        self._attempts = {}  # row id -> failed flushes so far
+        self._task = None
+        self._kick = None
+        self._writing = asyncio.Lock()  # one write at a time; flush() waits for the loop's
+        self.flushes = 0
+        self.written = 0
+        self.failed = 0  # flush attempts that failed
+        self.dropped = 0  # rows rejected by the database or out of retries
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_ms > 0
+
+    def add(self, rows):
+        # stamp now, not at flush time
+        now = datetime.now(timezone.utc)
+        self._rows.extend({"timestamp": now, **r} for r in rows)
+        if self._task is None or self._task.done():
+            self._kick = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+        if len(self._rows) >= self.max_rows:
+            self._kick.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._kick.wait(), self.flush_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._kick.clear()
+            if not await self.flush():
+                # back off a full interval before retrying
+                await asyncio.sleep(self.flush_ms / 1000)
+
+    async def flush(self) -> bool:
+        """
+        Write the rows buffered so far, after any write already in flight.
+        True once they are all committed (or dropped as rejected); False if
+        some are still buffered for a retry.
+        """
+        async with self._writing:
+            rows, self._rows = self._rows, []
+            retry = await asyncio.to_thread(self._write, rows) if rows else []
+            # keep them ahead of newer rows
+            self._rows[:0] = retry
+        return not retry
+
+    def _insert(self, rows):
+        db = SessionLocal()
+        try:
+            self.written += len(insert_attendance(db, rows))
+            db.commit()
+            self.flushes += 1
+        except Exception:
+            db.rollback()
+            self.failed += 1
+            raise
+        finally:
+            db.close()
+
+    def _write(self, rows) -> list:
+        """
+        Insert and commit `rows`; returns the rows to retry later. A batch
+        the database rejects is split and written one row at a time.
+        """
+        try:
+            self._insert(rows)
+        except (IntegrityError, DataError) as exc:
+            if len(rows) > 1:
+                logger.warning("attendance flush of %d rows rejected, writing them one by one", len(rows))
+                return [r for row in rows for r in self._write([row])]
+            self._drop(rows[0], "rejected: " + str(exc.orig).splitlines()[0])
+            return []
+        except Exception:
+            logger.exception("attendance flush of %d rows failed", len(rows))
+            return self._retry_later(rows)
+        for row in rows:
+            self._attempts.pop(row["id"], None)
+        return []
+
+    def _retry_later(self, rows) -> list:
+        retry = []
+        for row in rows:
+            attempts = self._attempts.get(row["id"], 0) + 1
+            if attempts > self.max_retries:
+                self._drop(row, f"still failing after {attempts} flushes")
+                continue
+            self._attempts[row["id"]] = attempts
+            retry.append(row)
+        return retry
+
+    def _drop(self, row, reason):
+        self._attempts.pop(row["id"], None)
+        self.dropped += 1
+        logger.error(
+            "dropping attendance of student %s in session %s (%s)",
+            row["student_id"], row["session_id"], reason,
+        )
+
+    def flush_sync(self):
+        """Write whatever is buffered (used at shutdown, off the event loop's flushes)."""
+        rows, self._rows = self._rows, []
+        retry = self._write(rows) if rows else []
+        if retry:
+            self._rows[:0] = retry
+            logger.error("%d buffered attendance rows could not be written", len(retry))
+
+    def stats(self):
+        return {
+            "flush_ms": self.flush_ms,
+            "buffered": len(self._rows),
+            "flushes": self.flushes,
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+attendance_buffer = AttendanceBuffer()
+
+
+def record_attendance(db, rows) -> set:
+    """
+    Record attendance rows from the kiosk: buffered when write-behind is
+    enabled, otherwise inserted and committed right away. Returns the
+    student_ids recorded (buffered rows count as recorded; the flush drops
+    duplicates).
+    """
+    if attendance_buffer.enabled:
+        attendance_buffer.add(rows)
+        return {r["student_id"] for r in rows}
+    inserted = insert_attendance(db, rows)
+    db.commit()
+    return inserted
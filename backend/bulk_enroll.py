@@ -0,0 +1,258 @@
+# backend/bulk_enroll.py
+"""
+Bulk face enrollment from a ZIP archive or directory laid out as
+
+    <enrollment_no>/<any name>.jpg|.jpeg|.png
+
+Entries are read one student at a time straight from the archive (never
+extracted as a whole), embedded in chunks on an `InferencePool` (several
+students in flight at once, one per worker), and each student's
+FaceEmbedding rows are bulk-inserted and committed together with their
+template.
+
+Database work, archive reads and journal writes run in worker threads
+(each student's DB steps with their own Session), so an import started
+from the API never blocks the event loop the kiosks are served from.
+
+Every finished student is appended to a JSON-lines journal, so re-running
+the same archive skips students already done; images whose raw file is
+already enrolled for the student are skipped too, which makes a crash
+between commit and journal write harmless.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import zipfile
+from pathlib import Path, PurePosixPath
+
+from sqlalchemy import func, insert
+
+from . import config, face_service
+from .embeddings import encode_embedding
+from .face_templates import add_samples
+from .file_store import store
+from .models import FaceEmbedding, User
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+
+# ---------- Sources ----------
+
+class ArchiveSource:
+    """Lists `enrollment_no -> [entry]` up front and reads entries lazily."""
+
+    def __init__(self, path_or_file):
+        self.dir = None
+        self.zip = None
+        if isinstance(path_or_file, (str, Path)) and Path(path_or_file).is_dir():
+            self.dir = Path(path_or_file)
+        else:
+            # a seekable file object works too (e.g. an uploaded spooled file)
+            self.zip = zipfile.ZipFile(path_or_file)
+
+    def _names(self):
+        if self.dir is not None:
+            return [p.relative_to(self.dir).as_posix() for p in self.dir.rglob("*") if p.is_file()]
+        return [i.filename for i in self.zip.infolist() if not i.is_dir()]
+
+    def students(self) -> dict:
+        grouped = {}
+        for name in sorted(self._names()):
+            parts = PurePosixPath(name).parts
+            if len(parts) < 2 or any(p.startswith((".", "__MACOSX")) for p in parts):
+                continue
+            if PurePosixPath(name).suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            # the student folder may be nested under a top-level folder
+            grouped.setdefault(parts[-2], []).append(name)
+        return grouped
+
+    def read(self, name) -> bytes:
+        if self.dir is not None:
+            return (self.dir / name).read_bytes()
+        with self.zip.open(name) as f:
+            return f.read()
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+
+
+def archive_digest(fileobj, chunk_size=1 << 20) -> str:
+    """SHA-256 of a file object (rewound afterwards), used as the job id."""
+    h = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(chunk_size), b""):
+        h.update(block)
+    fileobj.seek(0)
+    return h.hexdigest()
+
+
+# ---------- Journal ----------
+
+class Journal:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.done = {}
+        self._lock = threading.Lock()  # records come from several worker threads
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        entry = json.loads(line)
+                        self.done[entry["enrollment_no"]] = entry
+
+    def record(self, entry: dict):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self.done[entry["enrollment_no"]] = entry
+
+
+# ---------- Enrollment ----------
+
+async def _embed_student(pool, images, chunk_size, slots):
+    async def run(chunk):
+        # at most `workers` bulk jobs on the pool, so kiosk traffic sharing
+        # it is never pushed into 503s
+        async with slots:
+            return await pool.run(face_service.enrollment_embeddings, chunk)
+
+    chunks = [images[i:i + chunk_size] for i in range(0, len(images), chunk_size)]
+    results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+    return [r for chunk in results for r in chunk]
+
+
+def _store_raw(images):
+    return [store.put("raw", data, face_service.Frame(data).ext) for data in images]
+
+
+def _find_users(session_factory, enrollment_nos):
+    with session_factory() as db:
+        users = db.query(User).filter(User.enrollment_no.in_(enrollment_nos)).all()
+        db.expunge_all()  # read-only from here on, in other threads
+    return {u.enrollment_no: u for u in users}
+
+
+def _known_paths(session_factory, user_id):
+    with session_factory() as db:
+        return {
+            p for (p,) in db.query(FaceEmbedding.image_path).filter(FaceEmbedding.user_id == user_id)
+        }
+
+
+def _commit_student(session_factory, user, keys, results, on_template):
+    rows, embeddings, reasons = [], [], {}
+    for key, res in zip(keys, results):
+        if res["embedding"] is None:
+            reasons[res["reason"]] = reasons.get(res["reason"], 0) + 1
+            continue
+        rows.append({
+            "user_id": user.id,
+            "embedding": encode_embedding(res["embedding"]),
+            "image_path": store.uri(key),
+        })
+        embeddings.append(res["embedding"])
+    pruned = 0
+    with session_factory() as db:
+        if rows:
+            db.execute(insert(FaceEmbedding), rows)
+            template, pruned = add_samples(db, user.id, embeddings)
+            sample_count = template.sample_count
+        else:
+            sample_count = db.query(func.count(FaceEmbedding.id)).filter_by(user_id=user.id).scalar()
+        db.commit()
+        if rows and on_template is not None:
+            on_template(user, template)
+    return len(rows), reasons, pruned, sample_count
+
+
+async def enroll_archive(session_factory, source: ArchiveSource, pool, journal: Journal = None,
+                         chunk_size=None, on_template=None, progress=None):
+    """
+    Enroll every student folder in `source`. `pool` runs the face work
+    (the shared inference pool for the API, a dedicated process pool for
+    the CLI); `session_factory()` opens the Session for each DB step, in a
+    worker thread; `on_template(user, template)` is called (in that
+    thread) after each commit. Returns one report dict per student folder,
+    in archive order.
+    """
+    chunk_size = chunk_size or config.BATCH_MAX_SIZE
+    students = await asyncio.to_thread(source.students)
+    users = await asyncio.to_thread(_find_users, session_factory, list(students)) if students else {}
+
+    reports = {}
+    window = asyncio.Semaphore(max(1, pool.workers))
+    slots = asyncio.Semaphore(max(1, pool.workers))
+
+    async def process(enrollment_no, user, images):
+        try:
+            keys = await asyncio.to_thread(_store_raw, images)
+            known = await asyncio.to_thread(_known_paths, session_factory, user.id)
+            fresh = [i for i, k in enumerate(keys) if store.uri(k) not in known]
+            results = await _embed_student(pool, [images[i] for i in fresh], chunk_size, slots)
+            accepted, reasons, pruned, sample_count = await asyncio.to_thread(
+                _commit_student, session_factory, user, [keys[i] for i in fresh], results, on_template
+            )
+            report = {
+                "enrollment_no": enrollment_no,
+                "status": "enrolled",
+                "accepted": accepted,
+                "rejected": len(fresh) - accepted,
+                "rejected_reasons": reasons,
+                "duplicates": len(images) - len(fresh),
+                "pruned": pruned,
+                "sample_count": sample_count,
+                "complete": sample_count >= config.MIN_SAMPLES_PER_STUDENT,
+            }
+        except Exception as exc:
+            report = {"enrollment_no": enrollment_no, "status": "failed", "error": str(exc)}
+        finally:
+            window.release()
+        if journal is not None and report["status"] != "failed":
+            await asyncio.to_thread(journal.record, report)
+        reports[enrollment_no] = report
+        if progress is not None:
+            progress(report)
+
+    def read_all(names):
+        return [source.read(name) for name in names]
+
+    tasks = []
+    for enrollment_no, names in students.items():
+        if journal is not None and enrollment_no in journal.done:
+            reports[enrollment_no] = {**journal.done[enrollment_no], "resumed": True}
+            continue
+        user = users.get(enrollment_no)
+        if user is None:
+            reports[enrollment_no] = {"enrollment_no": enrollment_no, "status": "unknown_user",
+                                      "accepted": 0, "rejected": len(names)}
+            continue
+        await window.acquire()
+        # read this student's entries only now, so at most `workers`
+        # students' images are held in memory
+        try:
+            images = await asyncio.to_thread(read_all, names)
+        except Exception:
+            window.release()
+            raise
+        tasks.append(asyncio.create_task(process(enrollment_no, user, images)))
+    await asyncio.gather(*tasks)
+
+    return [reports[e] for e in students]
+
+
+def summarize(reports):
+    return {
+        "students": len(reports),
+        "enrolled": sum(r["status"] == "enrolled" for r in reports),
+        "unknown_user": sum(r["status"] == "unknown_user" for r in reports),
+        "failed": sum(r["status"] == "failed" for r in reports),
+        # enrolled but still below MIN_SAMPLES_PER_STUDENT
+        "incomplete": sum(r["status"] == "enrolled" and not r.get("complete", True) for r in reports),
+        "accepted": sum(r.get("accepted", 0) for r in reports),
+        "rejected": sum(r.get("rejected", 0) for r in reports),
+    }
@@ -1,5 +1,6 @@
 # backend/config.py
 from pathlib import Path
+import json
 import os
 from dotenv import load_dotenv
 
@@ -23,6 +24,93 @@ MODELS_DIR = STORAGE_ROOT / "models"
 # Recognition settings
 MATCH_SIMILARITY_THRESHOLD = float(os.getenv("MATCH_SIMILARITY_THRESHOLD", "0.65"))  # cosine similarity
 MIN_SAMPLES_PER_STUDENT = int(os.getenv("MIN_SAMPLES_PER_STUDENT", "8"))
+MAX_SAMPLES_PER_STUDENT = int(os.getenv("MAX_SAMPLES_PER_STUDENT", "20"))  # most diverse K kept, 0 = no cap
+
+# Enrollment quality gates (stricter than kiosk detection)
+ENROLL_MIN_DET_SCORE = float(os.getenv("ENROLL_MIN_DET_SCORE", "0.7"))
+ENROLL_MIN_FACE_SIZE = int(os.getenv("ENROLL_MIN_FACE_SIZE", "80"))  # px, shorter bbox side
+ENROLL_MIN_SHARPNESS = float(os.getenv("ENROLL_MIN_SHARPNESS", "40"))  # Laplacian variance of the aligned crop
+ENROLL_MAX_YAW = float(os.getenv("ENROLL_MAX_YAW", "0.35"))  # nose offset from eye midpoint / eye distance
+
+# Embedding storage (FaceEmbedding.embedding is raw bytes, see embeddings.py)
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "512"))
+EMBEDDING_STORAGE_DTYPE = os.getenv("EMBEDDING_STORAGE_DTYPE", "float32")  # float32 | float16
+TEMPLATE_PROTOTYPES = int(os.getenv("TEMPLATE_PROTOTYPES", "0"))  # k medoids per student, 0 = centroid only
+
+# Gallery search backend: "brute" (exact) or "ivf" (approximate, for large galleries)
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "brute")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # coarse lists, 0 = sqrt(rows)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))  # lists scanned per query; higher = better recall, slower
+IVF_MIN_ROWS = int(os.getenv("IVF_MIN_ROWS", "5000"))  # below this the IVF backend searches exactly
+GALLERY_INDEX_DIR = MODELS_DIR / "gallery"  # persisted gallery matrix + index, memory-mapped at startup
+
+# Face pipeline: detector first, then recognition only on the selected faces
+FACE_MODULES = os.getenv("FACE_MODULES", "detection,recognition").split(",")  # buffalo_l heads to load
+MIN_FACE_SIZE = int(os.getenv("MIN_FACE_SIZE", "40"))  # px, shorter bbox side
+MIN_DET_SCORE = float(os.getenv("MIN_DET_SCORE", "0.5"))
+
+# Detection profiles: frames are downscaled so their longer side is at most
+# max_side, then detected at det_size x det_size; boxes are mapped back to
+# full resolution for alignment. Close-range kiosk cameras (face fills much
+# of the frame) can use the cheaper "close" profile.
+KIOSK_PROFILES = {
+    "default": {"det_size": 640, "max_side": 1280},
+    "close": {"det_size": 320, "max_side": 640},
+}
+KIOSK_PROFILES.update(json.loads(os.getenv("KIOSK_PROFILES", "{}")))
+# kiosk_id -> profile name, e.g. {"lab-gate": "close"}
+KIOSK_ASSIGNMENTS = json.loads(os.getenv("KIOSK_ASSIGNMENTS", "{}"))
+DEFAULT_KIOSK_PROFILE = os.getenv("DEFAULT_KIOSK_PROFILE", "default")
+
+# Inference executor (InsightFace runs off the event loop)
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")  # thread | process
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "32"))  # queued + running before 503
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))  # frames per batched inference job, 1 = no batching
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))  # how long the first frame waits for company
+
+# File storage for raw/crops/probes (file_store.py): content-addressed,
+# hash-sharded under STORAGE_ROOT; 0 days = keep forever
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_RETENTION_DAYS = {"raw": 0, "crops": 180, "probes": 180}
+STORAGE_RETENTION_DAYS.update(json.loads(os.getenv("STORAGE_RETENTION_DAYS", "{}")))
+
+BULK_JOBS_DIR = STORAGE_ROOT / "jobs"  # resume journals of bulk enrollment runs
+
+# Multicam fusion of several frames of one person: "max" (best frame),
+# "topk_mean" (mean of each student's MULTICAM_TOPK best frame scores) or
+# "quality_mean" (score the detector-score-weighted mean probe)
+MULTICAM_FUSION = os.getenv("MULTICAM_FUSION", "max")
+MULTICAM_TOPK = int(os.getenv("MULTICAM_TOPK", "2"))
+MULTICAM_EARLY_EXIT_SCORE = float(os.getenv("MULTICAM_EARLY_EXIT_SCORE", "0.8"))  # stop decoding frames, 0 = off
+MULTICAM_WAVE = int(os.getenv("MULTICAM_WAVE", str(INFERENCE_WORKERS)))  # frames detected concurrently
+
+# Kiosk face tracking (tracker.py): frames whose face overlaps a recently
+# recognized, already-marked track skip recognition
+TRACKING_ENABLED = os.getenv("TRACKING_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACK_IOU = float(os.getenv("TRACK_IOU", "0.5"))  # box overlap linking a face to a track
+TRACK_EMBED_SIM = float(os.getenv("TRACK_EMBED_SIM", "0.7"))  # embedding similarity linking a face to a track
+TRACK_MAX_GAP_S = float(os.getenv("TRACK_MAX_GAP_S", "1.5"))  # track dropped after this long unseen
+TRACK_REVERIFY_S = float(os.getenv("TRACK_REVERIFY_S", "3"))  # recognition re-run at least this often per track
+RECENT_MARK_TTL_S = float(os.getenv("RECENT_MARK_TTL_S", "60"))  # recently-marked (session, student) cache
+
+# Attendance write-behind (attendance_writer.py): 0 = insert + commit per match
+ATTENDANCE_FLUSH_MS = float(os.getenv("ATTENDANCE_FLUSH_MS", "0"))
+ATTENDANCE_BUFFER_MAX = int(os.getenv("ATTENDANCE_BUFFER_MAX", "500"))  # rows that force an early flush
+ATTENDANCE_FLUSH_RETRIES = int(os.getenv("ATTENDANCE_FLUSH_RETRIES", "5"))  # failed flushes before a row is dropped
+
+# Active-session cache (session_cache.py); start/end invalidate it, the TTL
+# bounds staleness across API worker processes
+ACTIVE_SESSIONS_TTL_S = float(os.getenv("ACTIVE_SESSIONS_TTL_S", "5"))
+SESSION_STREAM_HEARTBEAT_S = float(os.getenv("SESSION_STREAM_HEARTBEAT_S", "15"))  # SSE keep-alive / expiry check
+
+# Probe images are written after the response by a background thread
+# (probe_writer.py); only these outcomes are kept
+PROBE_KEEP = [s for s in os.getenv("PROBE_KEEP", "matched").split(",") if s]
+PROBE_UNRESOLVED_SAMPLE_RATE = float(os.getenv("PROBE_UNRESOLVED_SAMPLE_RATE", "0.1"))  # 0..1
+PROBE_CROP_ONLY = os.getenv("PROBE_CROP_ONLY", "false").lower() in ("1", "true", "yes")
+PROBE_CROP_MARGIN = float(os.getenv("PROBE_CROP_MARGIN", "0.25"))  # of bbox size, per side
+PROBE_QUEUE_MAX = int(os.getenv("PROBE_QUEUE_MAX", "256"))  # pending writes before probes are dropped
 
 # Ensure folders exist
 for d in (RAW_DIR, CROPS_DIR, PROBES_DIR, MODELS_DIR):
@@ -0,0 +1,51 @@
+# backend/embeddings.py
+import numpy as np
+
+from .config import EMBEDDING_DIM, EMBEDDING_STORAGE_DTYPE
+
+
+_DTYPES = {
+    "float32": np.dtype("<f4"),
+    "float16": np.dtype("<f2"),
+}
+_BY_ITEMSIZE = {dt.itemsize: dt for dt in _DTYPES.values()}
+
+
+def storage_dtype():
+    try:
+        return _DTYPES[EMBEDDING_STORAGE_DTYPE]
+    except KeyError:
+        raise ValueError(f"unsupported EMBEDDING_STORAGE_DTYPE '{EMBEDDING_STORAGE_DTYPE}'")
+
+
+def encode_embedding(vec) -> bytes:
+    """Pack an embedding (list or array) into little-endian bytes for storage."""
+    arr = np.asarray(vec, dtype=np.float32).reshape(EMBEDDING_DIM)
+    return arr.astype(storage_dtype(), copy=False).tobytes()
+
+
+def decode_embedding(buf) -> np.ndarray:
+    """
+    Read a stored embedding back as float32.
+    float32 rows are returned as a zero-copy view over `buf`; float16 rows
+    are detected from the byte length and widened.
+    """
+    if isinstance(buf, (list, tuple)):
+        # legacy JSON rows that have not been migrated yet
+        return np.asarray(buf, dtype=np.float32)
+    itemsize, rem = divmod(len(buf), EMBEDDING_DIM)
+    dt = _BY_ITEMSIZE.get(itemsize)
+    if rem or dt is None:
+        raise ValueError(f"embedding blob of {len(buf)} bytes does not match EMBEDDING_DIM={EMBEDDING_DIM}")
+    arr = np.frombuffer(buf, dtype=dt)
+    return arr if dt.itemsize == 4 else arr.astype(np.float32)
+
+
+def decode_many(bufs) -> np.ndarray:
+    """Stack stored embeddings into a (n, EMBEDDING_DIM) float32 matrix."""
+    if not bufs:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    out = np.empty((len(bufs), EMBEDDING_DIM), dtype=np.float32)
+    for i, buf in enumerate(bufs):
+        out[i] = decode_embedding(buf)
+    return out
@@ -1,106 +1,486 @@
 # backend/face_service.py
 
+import asyncio
 import base64
-from io import BytesIO
-from pathlib import Path
+import threading
+import time
 
 import cv2
 import numpy as np
-from PIL import Image
 
 from insightface.app import FaceAnalysis
+from insightface.utils import face_align
 
+from . import config
 from .config import CROPS_DIR, MODELS_DIR
+from .inference import pool
+from .tracker import overlaps_any
 
 
-# ---------- Model setup (detector + recognizer in one) ----------
+# ---------- Model setup (detector + recognizer only) ----------
 
 def _create_face_app():
     """
-    Create a FaceAnalysis app that does both detection and recognition.
-    Uses CPU (ctx_id = -1).
+    Create a FaceAnalysis app with only the detection and recognition
+    models loaded (FACE_MODULES); the other buffalo_l heads (genderage,
+    2D/3D landmarks) are never run. Uses CPU (ctx_id = -1).
     """
     app = FaceAnalysis(
         name="buffalo_l",           # common bundled model (det + rec)
         root=str(MODELS_DIR),       # where to cache models (optional, but you have MODELS_DIR)
+        allowed_modules=config.FACE_MODULES,
     )
     # det_size can be tuned; 640x640 is a good default
     app.prepare(ctx_id=-1, det_size=(640, 640))
     return app
 
 
-face_app = _create_face_app()  # load once at import
+_local = threading.local()
+
+
+def get_face_app():
+    """
+    FaceAnalysis instance owned by the calling thread. Inference workers
+    (see inference.py) each load their own copy on first use, so ONNX
+    sessions are never shared across threads.
+    """
+    app = getattr(_local, "face_app", None)
+    if app is None:
+        app = _local.face_app = _create_face_app()
+    return app
 
 
 # ---------- Helpers ----------
 
+def decode_image(data):
+    """
+    Decode compressed image bytes (bytes / bytearray / memoryview) straight
+    into an OpenCV BGR array with a single allocation.
+    """
+    arr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if arr is None:
+        raise ValueError("could not decode image data")
+    return arr
+
+
+def _b64_to_bytes(img_b64: str) -> bytes:
+    """Strip an optional data: header and base64-decode (raises ValueError)."""
+    header, data = (img_b64.split(",", 1) if "," in img_b64 else (None, img_b64))
+    return base64.b64decode(data)
+
+
 def _b64_to_cv2(img_b64: str):
     """Convert base64 image (with or without data: header) to OpenCV BGR array."""
-    header, data = (img_b64.split(",", 1) if "," in img_b64 else (None, img_b64))
-    b = base64.b64decode(data)
-    img = Image.open(BytesIO(b)).convert("RGB")
-    arr = np.array(img)[:, :, ::-1]  # RGB -> BGR for cv2
-    return arr
+    return decode_image(_b64_to_bytes(img_b64))
+
+
+class Frame:
+    """
+    One uploaded image: the original compressed bytes plus the BGR array,
+    decoded at most once and only when detection needs it. Probes are
+    persisted from the original bytes untouched (no re-encode).
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self._image = None
+
+    @classmethod
+    def from_b64(cls, b64_str: str):
+        return cls(_b64_to_bytes(b64_str))
+
+    @property
+    def image(self):
+        if self._image is None:
+            self._image = decode_image(self.data)
+        return self._image
+
+    @property
+    def ext(self) -> str:
+        return ".png" if self.data[:8] == b"\x89PNG\r\n\x1a\n" else ".jpg"
+
+    def __reduce__(self):
+        # only the compressed bytes cross process boundaries
+        return (Frame, (self.data,))
+
+
+def load_image(src):
+    """Accept a Frame, a base64 string or raw image bytes."""
+    if isinstance(src, Frame):
+        return src.image
+    if isinstance(src, str):
+        return _b64_to_cv2(src)
+    return decode_image(src)
 
 
 # ---------- Detection & embedding ----------
+#
+# The pipeline is split: the detector runs first, the target face(s) are
+# selected from its boxes, and only those aligned crops go through the
+# recognizer.
+
+def resolve_profile(kiosk_id=None):
+    """Detection profile for a kiosk: its assignment, a profile name, or the default."""
+    name = config.KIOSK_ASSIGNMENTS.get(kiosk_id, kiosk_id) if kiosk_id else None
+    return config.KIOSK_PROFILES.get(name) or config.KIOSK_PROFILES[config.DEFAULT_KIOSK_PROFILE]
+
+
+def detect_faces(cv2_img, kiosk_id=None):
+    """
+    Run the detector only. Returns a list of dicts
+    { 'bbox': (x1, y1, x2, y2), 'kps': 5x2 landmarks, 'det_score': float }
+    with bboxes clamped to the image.
+
+    Large frames are downscaled to the kiosk profile's max_side and
+    detected at its det_size; boxes and landmarks are scaled back so crops
+    and alignment use the full-resolution frame.
+    """
+    profile = resolve_profile(kiosk_id)
+    h, w = cv2_img.shape[:2]
+    scale = min(1.0, profile["max_side"] / max(h, w))
+    small = cv2_img
+    if scale < 1.0:
+        small = cv2.resize(cv2_img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+    det = profile["det_size"]
+    bboxes, kpss = get_face_app().det_model.detect(
+        small, input_size=(det, det), max_num=0, metric="default"
+    )
+    if bboxes is None or len(bboxes) == 0:
+        return []
+    if scale < 1.0:
+        bboxes = bboxes.copy()
+        bboxes[:, :4] /= scale
+        if kpss is not None:
+            kpss = kpss / scale
+
+    faces = []
+    for i in range(len(bboxes)):
+        x1, y1, x2, y2 = map(int, bboxes[i, :4])
+        faces.append({
+            "bbox": (max(0, x1), max(0, y1), min(w - 1, x2), min(h - 1, y2)),
+            "kps": kpss[i] if kpss is not None else None,
+            "det_score": float(bboxes[i, 4]),
+        })
+    return faces
+
+
+def _area(face):
+    x1, y1, x2, y2 = face["bbox"]
+    return (x2 - x1) * (y2 - y1)
+
+
+def select_faces(faces, mode="largest"):
+    """
+    Drop detections below MIN_DET_SCORE / MIN_FACE_SIZE, then keep either
+    the single largest face ("largest") or every remaining one ("all").
+    """
+    keep = [
+        f for f in faces
+        if f["det_score"] >= config.MIN_DET_SCORE
+        and min(f["bbox"][2] - f["bbox"][0], f["bbox"][3] - f["bbox"][1]) >= config.MIN_FACE_SIZE
+    ]
+    if mode == "largest":
+        return [max(keep, key=_area)] if keep else []
+    return sorted(keep, key=_area, reverse=True)
+
+
+def embed_faces(cv2_img, faces):
+    """
+    Align the selected faces and embed them with one recognizer call.
+    Returns an (n, 512) array of L2-normalized embeddings.
+    """
+    if not faces:
+        return np.zeros((0, config.EMBEDDING_DIM), dtype=np.float32)
+    rec_model = get_face_app().models["recognition"]
+    size = rec_model.input_size[0]
+    crops = [face_align.norm_crop(cv2_img, landmark=f["kps"], image_size=size) for f in faces]
+    return _normalize_rows(rec_model.get_feat(crops).reshape(len(crops), -1))
+
+
+def _normalize_rows(feats):
+    return feats / np.linalg.norm(feats, axis=1, keepdims=True)
+
 
 def detect_and_crop(cv2_img):
     """
     Detect faces and return list of dicts:
-    { 'bbox': (x1, y1, x2, y2), 'crop': crop_img, 'face': face_obj }
+    { 'bbox': (x1, y1, x2, y2), 'crop': crop_img, 'kps': ..., 'det_score': ... }
+    """
+    faces = detect_faces(cv2_img)
+    for f in faces:
+        x1, y1, x2, y2 = f["bbox"]
+        f["crop"] = cv2_img[y1:y2, x1:x2].copy()
+    return faces
+
+
+def get_embedding(src, kiosk_id=None, skip_boxes=None):
     """
-    # face_app.get returns a list of Face objects
-    faces = face_app.get(cv2_img)
+    Takes a Frame, a base64 image string or raw image bytes, returns
+    (embedding_list, bbox) for the largest face. If no face: (None, None).
+    If the face overlaps one of `skip_boxes` (faces the kiosk tracker has
+    already resolved), recognition is skipped: (None, bbox).
+    """
+    img = load_image(src)
+    faces = select_faces(detect_faces(img, kiosk_id), mode="largest")
     if not faces:
-        return []
+        return None, None
+    if skip_boxes and overlaps_any(faces[0]["bbox"], skip_boxes):
+        return None, faces[0]["bbox"]
 
-    h, w = cv2_img.shape[:2]
-    crops = []
+    embedding = embed_faces(img, faces)[0]
+    return embedding.tolist(), faces[0]["bbox"]
 
-    for f in faces:
-        x1, y1, x2, y2 = map(int, f.bbox)
 
-        # clamp bbox to image bounds
-        x1, y1 = max(0, x1), max(0, y1)
-        x2, y2 = min(w - 1, x2), min(h - 1, y2)
+def get_probe(src, kiosk_id=None):
+    """
+    Like get_embedding, but returns (embedding array, bbox, det_score) so
+    callers can weight several probes; (None, None, 0.0) when the frame has
+    no usable face or cannot be decoded.
+    """
+    try:
+        img = load_image(src)
+    except ValueError:
+        return None, None, 0.0
+    faces = select_faces(detect_faces(img, kiosk_id), mode="largest")
+    if not faces:
+        return None, None, 0.0
+    return embed_faces(img, faces)[0], faces[0]["bbox"], faces[0]["det_score"]
+
+
+# ---------- Enrollment quality ----------
+
+def face_quality(face, aligned):
+    """
+    Quality measures of a detected face and its aligned crop:
+    det_score, size (shorter bbox side), sharpness (Laplacian variance of
+    the aligned crop, so independent of the frame resolution) and yaw
+    (horizontal nose offset from the eye midpoint, in eye distances).
+    """
+    x1, y1, x2, y2 = face["bbox"]
+    gray = cv2.cvtColor(aligned, cv2.COLOR_BGR2GRAY)
+    quality = {
+        "det_score": face["det_score"],
+        "size": min(x2 - x1, y2 - y1),
+        "sharpness": float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        "yaw": 0.0,
+    }
+    kps = face["kps"]
+    if kps is not None:
+        eye_mid = (kps[0] + kps[1]) / 2
+        eye_dist = max(float(np.linalg.norm(kps[1] - kps[0])), 1e-6)
+        quality["yaw"] = float(abs(kps[2][0] - eye_mid[0]) / eye_dist)
+    return quality
 
-        crop = cv2_img[y1:y2, x1:x2].copy()
-        crops.append({
-            "bbox": (x1, y1, x2, y2),
-            "crop": crop,
-            "face": f,          # keep Face object so we can use its embedding
-        })
 
-    return crops
+def quality_issue(quality):
+    """Name of the first enrollment gate the face fails, or None."""
+    if quality["det_score"] < config.ENROLL_MIN_DET_SCORE:
+        return "low_score"
+    if quality["size"] < config.ENROLL_MIN_FACE_SIZE:
+        return "too_small"
+    if quality["sharpness"] < config.ENROLL_MIN_SHARPNESS:
+        return "blurry"
+    if quality["yaw"] > config.ENROLL_MAX_YAW:
+        return "pose"
+    return None
 
 
-def get_embedding_from_b64(b64_str: str):
+def enrollment_embeddings(srcs):
     """
-    Takes a base64 image string, returns (embedding_list, bbox) for the largest face.
-    If no face: (None, None).
+    Enrollment counterpart of get_embeddings_batch: the largest face of
+    each image is quality-gated before recognition. Returns one dict per
+    image: { 'embedding': list or None, 'reason': None or why it was
+    rejected, 'quality': {...} }. Undecodable images are rejected, not raised.
     """
-    img = _b64_to_cv2(b64_str)
-    crops = detect_and_crop(img)
-    if not crops:
-        return None, None
+    rec_model = get_face_app().models["recognition"]
+    size = rec_model.input_size[0]
+
+    results, crops, owners = [], [], []
+    for i, src in enumerate(srcs):
+        try:
+            img = load_image(src)
+        except ValueError:
+            results.append({"embedding": None, "reason": "undecodable", "quality": None})
+            continue
+        faces = select_faces(detect_faces(img), mode="largest")
+        if not faces:
+            results.append({"embedding": None, "reason": "no_face", "quality": None})
+            continue
+        aligned = face_align.norm_crop(img, landmark=faces[0]["kps"], image_size=size)
+        quality = face_quality(faces[0], aligned)
+        issue = quality_issue(quality)
+        results.append({"embedding": None, "reason": issue, "quality": quality})
+        if issue is None:
+            crops.append(aligned)
+            owners.append(i)
+
+    if crops:
+        feats = _normalize_rows(rec_model.get_feat(crops).reshape(len(crops), -1))
+        for i, feat in zip(owners, feats):
+            results[i]["embedding"] = feat.tolist()
+    return results
+
+
+# ---------- Batched detection & recognition ----------
+
+def get_all_embeddings_batch(srcs, kiosk_id=None):
+    """
+    Classroom mode: every face passing select_faces in each frame. All
+    crops of all frames go through the recognizer in one call. Returns one
+    (embeddings (n, 512) array, bboxes list) pair per frame; undecodable
+    frames yield no faces.
+    """
+    rec_model = get_face_app().models["recognition"]
+    size = rec_model.input_size[0]
+
+    crops, per_frame = [], []
+    for src in srcs:
+        try:
+            img = load_image(src)
+        except ValueError:
+            per_frame.append([])
+            continue
+        faces = select_faces(detect_faces(img, kiosk_id), mode="all")
+        crops.extend(face_align.norm_crop(img, landmark=f["kps"], image_size=size) for f in faces)
+        per_frame.append([f["bbox"] for f in faces])
 
-    # choose largest face by area
-    best = max(
-        crops,
-        key=lambda c: (c["bbox"][2] - c["bbox"][0]) * (c["bbox"][3] - c["bbox"][1]),
+    feats = (
+        _normalize_rows(rec_model.get_feat(crops).reshape(len(crops), -1))
+        if crops else np.zeros((0, config.EMBEDDING_DIM), dtype=np.float32)
     )
-    face = best["face"]
+    results, start = [], 0
+    for bboxes in per_frame:
+        results.append((feats[start:start + len(bboxes)], bboxes))
+        start += len(bboxes)
+    return results
 
-    # FaceAnalysis already provides L2-normalized embedding
-    embedding = face.normed_embedding  # numpy array
-    return embedding.tolist(), best["bbox"]
 
+def get_embeddings_batch(srcs, kiosk_ids=None, skip_boxes=None):
+    """
+    Batch counterpart of get_embedding: returns one (embedding_list, bbox)
+    or (None, None) per input frame (Frame, base64 string or raw bytes), or
+    the ValueError for a frame that does not decode, so one bad frame does
+    not fail the other requests sharing the batch.
+    `kiosk_ids` optionally gives the detection profile of each frame and
+    `skip_boxes` the tracker boxes whose faces are not recognized again.
 
-def save_probe_image_from_b64(b64_str: str, dest_path: Path):
+    The detector runs per frame (buffalo_l's det model is exported with a
+    fixed batch of 1), then the selected face of every frame is aligned and
+    all crops go through the ArcFace recognizer in a single ONNX call.
     """
-    Decode base64 image and save original image to dest_path.
+    rec_model = get_face_app().models["recognition"]
+    size = rec_model.input_size[0]
+
+    kiosk_ids = kiosk_ids or [None] * len(srcs)
+    skip_boxes = skip_boxes or [None] * len(srcs)
+    results = [(None, None)] * len(srcs)
+    crops, owners = [], []
+    for i, (src, kiosk_id) in enumerate(zip(srcs, kiosk_ids)):
+        try:
+            img = load_image(src)
+        except ValueError as exc:
+            results[i] = exc
+            continue
+        faces = select_faces(detect_faces(img, kiosk_id), mode="largest")
+        if not faces:
+            continue
+        if skip_boxes[i] and overlaps_any(faces[0]["bbox"], skip_boxes[i]):
+            results[i] = (None, faces[0]["bbox"])
+            continue
+        crops.append(face_align.norm_crop(img, landmark=faces[0]["kps"], image_size=size))
+        owners.append((i, faces[0]["bbox"]))
+
+    if crops:
+        feats = _normalize_rows(rec_model.get_feat(crops).reshape(len(crops), -1))
+        for (i, bbox), feat in zip(owners, feats):
+            results[i] = (feat.tolist(), bbox)
+    return results
+
+
+class BatchScheduler:
+    """
+    Collects frames submitted by concurrent requests for up to
+    BATCH_MAX_WAIT_MS (or until BATCH_MAX_SIZE frames are waiting), runs
+    them as one job on the inference pool and fans the results back out.
+    Several batches may be in flight at once, one per free worker.
     """
-    img = _b64_to_cv2(b64_str)
-    dest_path.parent.mkdir(parents=True, exist_ok=True)
-    cv2.imwrite(str(dest_path), img)
+
+    def __init__(self, max_size=None, max_wait_ms=None):
+        self.max_size = max_size or config.BATCH_MAX_SIZE
+        self.max_wait = (config.BATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self._queue = None
+        self._collector = None
+        self._running = set()  # batch tasks in flight; the loop only keeps weak refs
+        self.batches = 0
+        self.frames = 0
+
+    async def embed(self, src, kiosk_id=None, skip_boxes=None):
+        """
+        Awaitable (embedding_list, bbox) for the largest face in one frame,
+        given as a Frame, a base64 string or raw image bytes (see
+        get_embedding for `skip_boxes`).
+        """
+        if isinstance(src, memoryview):
+            src = src.tobytes()  # must be picklable for the process executor
+        if self.max_size <= 1:
+            return await pool.run(get_embedding, src, kiosk_id, skip_boxes)
+
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._collector = asyncio.create_task(self._collect())
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((src, kiosk_id, skip_boxes, fut))
+        return await fut
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        try:
+            results = await pool.run(
+                get_embeddings_batch,
+                [b for b, _, _, _ in batch],
+                [k for _, k, _, _ in batch],
+                [s for _, _, s, _ in batch],
+            )
+        except Exception as exc:
+            for *_, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        self.batches += 1
+        self.frames += len(batch)
+        for (*_, fut), res in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(res, Exception):
+                # only the request that sent the undecodable frame fails
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch_size": round(self.frames / max(self.batches, 1), 2),
+        }
+
+
+batcher = BatchScheduler()
@@ -0,0 +1,222 @@
+# backend/face_templates.py
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .config import EMBEDDING_DIM, MAX_SAMPLES_PER_STUDENT, TEMPLATE_PROTOTYPES
+from .embeddings import decode_many
+from .models import FaceEmbedding, FaceTemplate
+
+
+# ---------- Packing ----------
+
+def _pack(arr, dtype) -> bytes:
+    return np.ascontiguousarray(arr, dtype=dtype).tobytes()
+
+
+def template_centroid(t: FaceTemplate) -> np.ndarray:
+    return np.frombuffer(t.centroid, dtype="<f4")
+
+
+def template_sum(t: FaceTemplate) -> np.ndarray:
+    return np.frombuffer(t.running_sum, dtype="<f8")
+
+
+def template_prototypes(t: FaceTemplate) -> np.ndarray:
+    if not t.prototypes:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    return np.frombuffer(t.prototypes, dtype="<f4").reshape(-1, EMBEDDING_DIM)
+
+
+def _normalize(vec):
+    denom = np.linalg.norm(vec)
+    return vec / denom if denom > 0 else np.zeros_like(vec)
+
+
+# ---------- Prototypes ----------
+
+def select_medoids(mat, k: int, iters: int = 10) -> np.ndarray:
+    """
+    Pick k medoid samples from an (n, dim) matrix of normalized embeddings
+    (cosine distance, farthest-point initialisation, Voronoi iteration).
+    """
+    n = len(mat)
+    if k <= 0 or n == 0:
+        return np.zeros((0, mat.shape[1]), dtype=np.float32)
+    if n <= k:
+        return np.asarray(mat, dtype=np.float32)
+
+    sims = mat @ mat.T
+    medoids = [int(np.argmax(sims.sum(axis=1)))]
+    while len(medoids) < k:
+        nearest = sims[:, medoids].max(axis=1)
+        medoids.append(int(np.argmin(nearest)))
+
+    for _ in range(iters):
+        assign = np.argmax(sims[:, medoids], axis=1)
+        updated = []
+        for c in range(k):
+            members = np.flatnonzero(assign == c)
+            if len(members) == 0:
+                updated.append(medoids[c])
+                continue
+            within = sims[np.ix_(members, members)].sum(axis=1)
+            updated.append(int(members[np.argmax(within)]))
+        if updated == medoids:
+            break
+        medoids = updated
+
+    return np.asarray(mat[medoids], dtype=np.float32)
+
+
+def select_diverse(mat, k: int) -> np.ndarray:
+    """
+    Indices of k rows of an (n, dim) matrix of normalized embeddings chosen
+    by farthest-point selection: start from the sample closest to the
+    centroid, then repeatedly add the sample least similar to everything
+    chosen so far.
+    """
+    n = len(mat)
+    if n <= k:
+        return np.arange(n)
+    first = int(np.argmax(mat @ _normalize(mat.mean(axis=0))))
+    chosen = [first]
+    nearest = mat @ mat[first]  # similarity to the closest chosen sample
+    while len(chosen) < k:
+        i = int(np.argmin(nearest))
+        chosen.append(i)
+        nearest = np.maximum(nearest, mat @ mat[i])
+    return np.sort(chosen)
+
+
+# ---------- Maintenance ----------
+
+def _user_samples(db, user_id) -> np.ndarray:
+    blobs = [b for (b,) in db.query(FaceEmbedding.embedding).filter_by(user_id=user_id).all()]
+    return decode_many(blobs)
+
+
+def _fill_template(t: FaceTemplate, mat):
+    total = mat.sum(axis=0, dtype=np.float64)
+    t.running_sum = _pack(total, "<f8")
+    t.sample_count = len(mat)
+    t.centroid = _pack(_normalize(total / max(len(mat), 1)), "<f4")
+    if TEMPLATE_PROTOTYPES > 0:
+        t.prototypes = _pack(select_medoids(mat, TEMPLATE_PROTOTYPES), "<f4")
+    return t
+
+
+def _lock_template(db, user_id) -> FaceTemplate:
+    """
+    The user's FaceTemplate, locked (SELECT ... FOR UPDATE) until the
+    transaction ends, so concurrent enrollments of the same student
+    (train-face, bulk enroll) apply their samples one after the other.
+    A missing template is first created empty (sample_count 0), which
+    also serializes the first enrollment.
+    """
+    db.execute(
+        pg_insert(FaceTemplate)
+        .values(user_id=user_id, centroid=b"", running_sum=b"", sample_count=0)
+        .on_conflict_do_nothing(index_elements=[FaceTemplate.user_id])
+    )
+    return db.get(FaceTemplate, user_id, with_for_update=True, populate_existing=True)
+
+
+def update_template(db, user_id, new_embeddings) -> FaceTemplate:
+    """
+    Fold newly accepted embeddings into the user's FaceTemplate, creating
+    it if needed. Does not commit.
+    """
+    mat = np.asarray(new_embeddings, dtype=np.float64).reshape(-1, EMBEDDING_DIM)
+    t = _lock_template(db, user_id)
+    if t.sample_count:
+        total = template_sum(t).copy()
+        count = t.sample_count
+    else:
+        total = np.zeros(EMBEDDING_DIM, dtype=np.float64)
+        count = 0
+
+    total += mat.sum(axis=0)
+    count += len(mat)
+    t.running_sum = _pack(total, "<f8")
+    t.sample_count = count
+    t.centroid = _pack(_normalize(total / max(count, 1)), "<f4")
+
+    if TEMPLATE_PROTOTYPES > 0:
+        db.flush()  # make the caller's pending FaceEmbedding rows visible
+        t.prototypes = _pack(select_medoids(_user_samples(db, user_id), TEMPLATE_PROTOTYPES), "<f4")
+    return t
+
+
+def recompute_template(db, user_id) -> FaceTemplate:
+    """Rebuild one user's FaceTemplate from their stored samples. Does not commit."""
+    return _fill_template(_lock_template(db, user_id), _user_samples(db, user_id))
+
+
+def prune_samples(db, user_id, cap: int = None) -> int:
+    """
+    Keep only the `cap` most diverse of the user's FaceEmbedding rows
+    (select_diverse) and delete the rest. Returns the number deleted.
+    Does not commit.
+    """
+    cap = MAX_SAMPLES_PER_STUDENT if cap is None else cap
+    rows = db.query(FaceEmbedding.id, FaceEmbedding.embedding).filter_by(user_id=user_id).all()
+    if cap <= 0 or len(rows) <= cap:
+        return 0
+    keep = set(select_diverse(decode_many([b for _, b in rows]), cap).tolist())
+    drop = [row_id for i, (row_id, _) in enumerate(rows) if i not in keep]
+    db.query(FaceEmbedding).filter(FaceEmbedding.id.in_(drop)).delete(synchronize_session=False)
+    return len(drop)
+
+
+def add_samples(db, user_id, new_embeddings, cap: int = None):
+    """
+    Account for newly inserted FaceEmbedding rows: prune the user's samples
+    down to `cap` and rebuild the template if anything was dropped,
+    otherwise fold the new embeddings in incrementally. Does not commit.
+    Returns (template, number of pruned samples).
+    """
+    db.flush()  # make the caller's pending FaceEmbedding rows visible
+    _lock_template(db, user_id)  # before pruning, which reads all the samples
+    pruned = prune_samples(db, user_id, cap)
+    if pruned:
+        return recompute_template(db, user_id), pruned
+    return update_template(db, user_id, new_embeddings), 0
+
+
+def rebuild_templates(db, batch_size: int = 5000) -> int:
+    """
+    Recompute every FaceTemplate from the stored embeddings, streaming
+    face_embeddings ordered by user so only one user's samples are held
+    in memory at a time. Commits and returns the number of templates.
+    """
+    db.query(FaceTemplate).delete()
+    db.flush()
+
+    q = (
+        db.query(FaceEmbedding.user_id, FaceEmbedding.embedding)
+        .order_by(FaceEmbedding.user_id)
+        .yield_per(batch_size)
+    )
+
+    built = 0
+    current, blobs = None, []
+
+    def flush_user():
+        db.add(_fill_template(FaceTemplate(user_id=current), decode_many(blobs)))
+
+    for user_id, blob in q:
+        if user_id != current and blobs:
+            flush_user()
+            built += 1
+            blobs = []
+            if built % 500 == 0:
+                db.flush()
+                db.expunge_all()
+        current = user_id
+        blobs.append(blob)
+    if blobs:
+        flush_user()
+        built += 1
+
+    db.commit()
+    return built
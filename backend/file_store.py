@@ -0,0 +1,160 @@
+# backend/file_store.py
+"""
+Content-addressed storage for raw enrollment images, crops and probes.
+
+Every object is keyed by the SHA-256 of its bytes and sharded into two
+levels of subdirectories:
+
+    <kind>/<h[0:2]>/<h[2:4]>/<h><ext>      e.g. probes/3f/a9/3fa9...c1.jpg
+
+so no directory grows past a few hundred entries, and identical uploads
+are stored once. `FileStore` defines the interface the routers use; only
+the key layout and pruning logic are shared, so an S3-compatible backend
+only has to implement the primitive operations.
+"""
+import hashlib
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+from pathlib import Path
+
+from . import config
+
+KINDS = ("raw", "crops", "probes")
+
+
+class FileStore(ABC):
+    # ---------- Keys ----------
+
+    def key_for(self, kind, data, ext=".jpg") -> str:
+        if kind not in KINDS:
+            raise ValueError(f"unknown storage kind '{kind}'")
+        h = hashlib.sha256(data).hexdigest()
+        return f"{kind}/{h[:2]}/{h[2:4]}/{h}{ext}"
+
+    def put(self, kind, data, ext=".jpg") -> str:
+        """Store `data` under its content key (once) and return the key."""
+        key = self.key_for(kind, data, ext)
+        if self.exists(key):
+            self.touch(key)  # retention counts from the last upload
+        else:
+            self.write(key, data)
+        return key
+
+    # ---------- Backend primitives ----------
+
+    @abstractmethod
+    def write(self, key, data):
+        ...
+
+    @abstractmethod
+    def read(self, key) -> bytes:
+        ...
+
+    @abstractmethod
+    def exists(self, key) -> bool:
+        ...
+
+    @abstractmethod
+    def touch(self, key):
+        ...
+
+    @abstractmethod
+    def delete(self, key):
+        ...
+
+    @abstractmethod
+    def uri(self, key) -> str:
+        """What gets stored in `image_path` columns."""
+
+    @abstractmethod
+    def scan(self, kind):
+        """Yield (key, modified_unix_time) for every object of `kind`."""
+
+    # ---------- Retention ----------
+
+    def prune(self, kind, max_age_days, batch_size=500, dry_run=False, pause=0.0):
+        """
+        Delete objects of `kind` not written (or re-uploaded) in the last
+        `max_age_days`, `batch_size` at a time with an optional `pause`
+        between batches to keep I/O pressure low. Returns the number of
+        objects removed (or that would be, with `dry_run`).
+        """
+        cutoff = time.time() - max_age_days * 86400
+        removed = 0
+        batch = []
+        for key, mtime in self.scan(kind):
+            if mtime >= cutoff:
+                continue
+            batch.append(key)
+            if len(batch) >= batch_size:
+                removed += self._delete_batch(batch, dry_run)
+                batch = []
+                if pause:
+                    time.sleep(pause)
+        if batch:
+            removed += self._delete_batch(batch, dry_run)
+        return removed
+
+    def _delete_batch(self, keys, dry_run):
+        if not dry_run:
+            for key in keys:
+                self.delete(key)
+        return len(keys)
+
+
+class LocalFileStore(FileStore):
+    def __init__(self, root: Path = None):
+        self.root = Path(root or config.STORAGE_ROOT)
+
+    def _path(self, key) -> Path:
+        return self.root / key
+
+    def write(self, key, data):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write-then-rename so readers never see a partial file
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.part")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def read(self, key) -> bytes:
+        return self._path(key).read_bytes()
+
+    def exists(self, key) -> bool:
+        return self._path(key).exists()
+
+    def touch(self, key):
+        os.utime(self._path(key))
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def uri(self, key) -> str:
+        return str(self._path(key))
+
+    def scan(self, kind):
+        # also walks the flat files written before the sharded layout
+        base = self.root / kind
+        for dirpath, dirnames, filenames in os.walk(base):
+            for name in filenames:
+                if name.endswith(".part"):
+                    continue
+                path = Path(dirpath) / name
+                try:
+                    mtime = path.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                yield path.relative_to(self.root).as_posix(), mtime
+
+
+def make_store(kind=None) -> FileStore:
+    kind = kind or config.STORAGE_BACKEND
+    if kind == "local":
+        return LocalFileStore()
+    raise ValueError(f"unknown STORAGE_BACKEND '{kind}'")
+
+
+store = make_store()
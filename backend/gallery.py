@@ -0,0 +1,505 @@
+# backend/gallery.py
+import json
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import func
+
+from .config import (
+    EMBEDDING_DIM,
+    TEMPLATE_PROTOTYPES,
+    SEARCH_BACKEND,
+    IVF_MIN_ROWS,
+    GALLERY_INDEX_DIR,
+)
+from .face_templates import template_centroid, template_prototypes
+from .search_index import atomic_write, make_index, save_npy
+from .models import (
+    User,
+    RoleEnum,
+    FaceTemplate,
+    CourseEnrollment,
+    AttendanceRecord,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _snapshot_lock(directory: Path, exclusive: bool):
+    """
+    Advisory lock on a snapshot directory, so API worker processes sharing
+    GALLERY_INDEX_DIR never mix files of two snapshots: saves are
+    exclusive, loads shared.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(directory / ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield  # released when the file is closed
+
+
+class GalleryIndex:
+    """
+    Process-wide index of student face templates.
+
+    Each student owns `slots` consecutive rows of `matrix`: its medoid
+    prototypes when TEMPLATE_PROTOTYPES > 0 (padded with the centroid), or
+    just its L2-normalized centroid. `user_ids` / `names` / `enrollment_nos`
+    are parallel lists indexed by row // slots. Templates come from the
+    persisted FaceTemplate rows and training replaces a student's rows in
+    place; nearest-neighbour search goes through the configured backend
+    (see search_index.py).
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, slots: int = None, backend: str = None):
+        self.dim = dim
+        self.slots = slots or max(1, TEMPLATE_PROTOTYPES)
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._saved_version = None  # version matching the files in GALLERY_INDEX_DIR
+        self._clear()
+
+    def _clear(self, capacity: int = 0):
+        self._matrix = np.zeros((capacity * self.slots, self.dim), dtype=np.float32)
+        self.index = make_index(self._backend)
+        self.user_ids = []
+        self.names = []
+        self.enrollment_nos = []
+        self._slot_of = {}
+        self.size = 0  # number of students
+        self.loaded = False
+        # bumped on every change so derived views (session galleries) can refresh
+        self.version = getattr(self, "version", 0) + 1
+
+    # ---------- Build ----------
+
+    def build(self, db):
+        """
+        Load the gallery, preferring the memory-mapped snapshot in
+        GALLERY_INDEX_DIR when it matches the face_templates table and
+        otherwise reading one FaceTemplate row per student.
+        """
+        fingerprint = self._fingerprint(db)
+        if self.load(GALLERY_INDEX_DIR, fingerprint):
+            return
+
+        students = (
+            db.query(User.id, User.full_name, User.enrollment_no)
+            .filter(User.role == RoleEnum.STUDENT)
+            .all()
+        )
+        rows = (
+            db.query(FaceTemplate)
+            .join(User, User.id == FaceTemplate.user_id)
+            .filter(User.role == RoleEnum.STUDENT, FaceTemplate.sample_count > 0)
+            .all()
+        )
+        meta = {user_id: (name, enr) for user_id, name, enr in students}
+
+        with self._lock:
+            self._clear(capacity=len(rows))
+            for t in rows:
+                name, enr = meta.get(t.user_id, (None, None))
+                slot = self._append_slot(t.user_id, name, enr)
+                self._write_slot(slot, t)
+            self.index.fit(self.matrix)
+            self.loaded = True
+        self.save(GALLERY_INDEX_DIR, fingerprint)
+
+    def snapshot(self, db):
+        """Persist the current in-memory state (e.g. at shutdown) if it changed."""
+        if self.loaded and self.version != self._saved_version:
+            self.save(GALLERY_INDEX_DIR, self._fingerprint(db))
+
+    @staticmethod
+    def _fingerprint(db):
+        count, latest = db.query(func.count(FaceTemplate.user_id), func.max(FaceTemplate.updated_at)).one()
+        return {
+            "templates": int(count),
+            "updated_at": latest.isoformat() if latest else None,
+            "prototypes": TEMPLATE_PROTOTYPES,
+            "backend": SEARCH_BACKEND,
+        }
+
+    # ---------- Persistence ----------
+
+    def save(self, directory: Path, fingerprint: dict):
+        """
+        Snapshot the matrix, ids and search index for a fast restart. Every
+        file is replaced atomically (the current matrix may be a memory map
+        of the previous snapshot), gallery.json last so it never describes
+        files that were not fully written.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock, _snapshot_lock(directory, exclusive=True):
+            meta_path = directory / "gallery.json"
+            # a crash mid-save leaves no metadata, i.e. no snapshot to trust
+            meta_path.unlink(missing_ok=True)
+            save_npy(directory / "matrix.npy", self.matrix)
+            self.index.save(directory)
+            meta = {
+                "fingerprint": fingerprint,
+                "slots": self.slots,
+                "user_ids": [str(u) for u in self.user_ids],
+                "names": self.names,
+                "enrollment_nos": self.enrollment_nos,
+            }
+            atomic_write(meta_path, lambda f: f.write(json.dumps(meta)), "w")
+            self._saved_version = self.version
+
+    def load(self, directory: Path, fingerprint: dict) -> bool:
+        if not directory.is_dir():
+            return False
+        with _snapshot_lock(directory, exclusive=False):
+            return self._load(directory, fingerprint)
+
+    def _load(self, directory: Path, fingerprint: dict) -> bool:
+        meta_path, matrix_path = directory / "gallery.json", directory / "matrix.npy"
+        if not (meta_path.exists() and matrix_path.exists()):
+            return False
+        try:
+            meta = json.loads(meta_path.read_text())
+            if meta.get("fingerprint") != fingerprint or meta.get("slots") != self.slots:
+                return False
+            # copy-on-write mapping: pages are shared until a row is updated
+            matrix = np.load(matrix_path, mmap_mode="c")
+            user_ids = [uuid.UUID(u) for u in meta["user_ids"]]
+            if matrix.shape != (len(user_ids) * self.slots, self.dim):
+                raise ValueError(f"matrix shape {matrix.shape} does not match {len(user_ids)} students")
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            logger.warning("ignoring unreadable gallery snapshot in %s: %s", directory, exc)
+            return False
+
+        with self._lock:
+            self._clear()
+            self._matrix = matrix
+            self.user_ids = user_ids
+            self.names = meta["names"]
+            self.enrollment_nos = meta["enrollment_nos"]
+            self._slot_of = {u: i for i, u in enumerate(self.user_ids)}
+            self.size = len(self.user_ids)
+            try:
+                loaded = self.index.load(directory, mmap_mode="c", rows=len(matrix))
+            except (OSError, ValueError) as exc:
+                logger.warning("ignoring unreadable search index snapshot: %s", exc)
+                loaded = False
+            if not loaded:
+                self.index = make_index(self._backend)
+                self.index.fit(self.matrix)
+            self.loaded = True
+            # a re-fitted index is not on disk yet
+            self._saved_version = self.version if loaded else None
+        return True
+
+    # ---------- Incremental updates ----------
+
+    def register_user(self, user):
+        """Keep the cached name / enrollment number of a student in sync."""
+        if user.role != RoleEnum.STUDENT:
+            return
+        with self._lock:
+            slot = self._slot_of.get(user.id)
+            if slot is not None:
+                self.names[slot] = user.full_name
+                self.enrollment_nos[slot] = user.enrollment_no
+                self.version += 1
+
+    def upsert_template(self, user, template):
+        """Replace (or add) the rows for `user` from its updated template."""
+        if user.role != RoleEnum.STUDENT or not template.sample_count:
+            return
+        with self._lock:
+            if user.id not in self._slot_of:
+                self._append_slot(user.id, user.full_name, user.enrollment_no)
+            slot = self._slot_of[user.id]
+            self._write_slot(slot, template)
+            self.index.update(self.rows_of_slot(slot), self.matrix)
+            self.version += 1
+
+    def _append_slot(self, user_id, name, enrollment_no):
+        if (self.size + 1) * self.slots > len(self._matrix):
+            self._grow(max(16, 2 * self.size))
+        slot = self.size
+        self._slot_of[user_id] = slot
+        self.user_ids.append(user_id)
+        self.names.append(name)
+        self.enrollment_nos.append(enrollment_no)
+        self.size += 1
+        return slot
+
+    def _grow(self, capacity: int):
+        matrix = np.zeros((capacity * self.slots, self.dim), dtype=np.float32)
+        matrix[: self.size * self.slots] = self._matrix[: self.size * self.slots]
+        self._matrix = matrix
+
+    def _write_slot(self, slot: int, template):
+        rows = self._matrix[slot * self.slots:(slot + 1) * self.slots]
+        rows[:] = template_centroid(template)
+        if self.slots > 1:
+            protos = template_prototypes(template)[: self.slots]
+            rows[: len(protos)] = protos
+
+    def rows_of_slot(self, slot: int):
+        return np.arange(slot * self.slots, (slot + 1) * self.slots)
+
+    # ---------- Matching ----------
+
+    @property
+    def matrix(self):
+        return self._matrix[: self.size * self.slots]
+
+    def _candidate(self, slot: int, score: float):
+        return {
+            "student_id": self.user_ids[slot],
+            "score": score,
+            "name": self.names[slot],
+            "enrollment_no": self.enrollment_nos[slot],
+        }
+
+    def search(self, probe_vec, allowed=None):
+        """
+        Cosine-match an L2-normalized probe against the gallery. Returns the
+        best candidate as a dict, or None when nothing matches. `allowed` is
+        an optional boolean row mask (see SessionGallery).
+        """
+        probe = np.asarray(probe_vec, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            if self.size == 0:
+                return None
+            hit = self.index.search(self.matrix, probe, allowed)
+            if hit is None:
+                return None
+            row, score = hit
+            return self._candidate(row // self.slots, score)
+
+
+gallery = GalleryIndex()
+
+
+# ---------- Per-session candidate galleries ----------
+
+class SessionGallery:
+    """
+    Candidate view of the global gallery restricted to the students enrolled
+    in one ClassSession's subject, plus the set already marked present.
+
+    The candidate sub-matrix is copied out of the global index lazily and
+    re-sliced whenever the global index version changes. Very large
+    candidate sets on an approximate backend are searched through the
+    global index with a row mask instead.
+    """
+
+    def __init__(self, session_id, subject_id, end_time, member_ids, marked_ids, parent=gallery):
+        self.session_id = str(session_id)
+        self.subject_id = subject_id
+        self.end_time = end_time
+        self.member_ids = set(member_ids)
+        self.marked_ids = set(marked_ids)
+        self._parent = parent
+        self._lock = threading.Lock()
+        self._version = None
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._matrix = np.zeros((0, parent.dim), dtype=np.float32)
+        self._allowed = None  # row mask over the parent matrix (ANN mode)
+
+    def _sync(self):
+        parent = self._parent
+        if self._version == parent.version:
+            return
+        with parent._lock:
+            slots = sorted(parent._slot_of[u] for u in self.member_ids if u in parent._slot_of)
+            rows = np.concatenate([parent.rows_of_slot(s) for s in slots]) if slots else self._rows[:0]
+            if parent.index.kind != "brute" and len(rows) >= IVF_MIN_ROWS:
+                self._allowed = np.zeros(len(parent.matrix), dtype=bool)
+                self._allowed[rows] = True
+                self._matrix = self._matrix[:0]
+            else:
+                self._allowed = None
+                self._matrix = np.ascontiguousarray(parent.matrix[rows])
+            self._rows = rows
+            self._version = parent.version
+
+    def search(self, probe_vec):
+        """Best enrolled candidate for an L2-normalized probe, or None."""
+        parent = self._parent
+        probe = np.asarray(probe_vec, dtype=np.float32).reshape(parent.dim)
+        with self._lock:
+            self._sync()
+            if len(self._rows) == 0:
+                return None
+            if self._allowed is not None:
+                allowed = self._allowed
+            else:
+                scores = self._matrix @ probe
+                i = int(np.argmax(scores))
+                return parent._candidate(int(self._rows[i]) // parent.slots, float(scores[i]))
+        return parent.search(probe, allowed=allowed)
+
+    def score_many(self, probes):
+        """
+        Score an (m, dim) block of L2-normalized probes against every
+        candidate with one matrix product. Returns (slots, scores) where
+        scores[i, j] is probe i's best score over the rows of student slot
+        slots[j] (see `candidate`).
+        """
+        parent = self._parent
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, parent.dim)
+        with self._lock:
+            self._sync()
+            rows, matrix = self._rows, self._matrix
+            if self._allowed is not None:
+                # ANN mode keeps no copy; exact scoring of the rows is still one product
+                with parent._lock:
+                    matrix = parent.matrix[rows]
+        k = parent.slots
+        if len(rows) == 0:
+            return rows, np.zeros((len(probes), 0), dtype=np.float32)
+        scores = (probes @ matrix.T).reshape(len(probes), -1, k).max(axis=2)
+        return rows[::k] // k, scores
+
+    def fuse(self, probes, weights=None, strategy="max", k=2):
+        """
+        Fuse several probes of the same person into one decision:
+        "max" (best single frame), "topk_mean" (mean of each student's k
+        best frame scores) or "quality_mean" (score the weight-averaged
+        probe). Returns (slot, score, frame) where frame indexes the probe
+        that scored best for the chosen student, or None.
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, self._parent.dim)
+        slots, scores = self.score_many(probes)
+        if scores.shape[1] == 0:
+            return None
+        if strategy == "max":
+            fused = scores.max(axis=0)
+        elif strategy == "topk_mean":
+            fused = np.sort(scores, axis=0)[-min(k, len(scores)):].mean(axis=0)
+        elif strategy == "quality_mean":
+            w = np.ones(len(probes)) if weights is None else np.asarray(weights, dtype=np.float64)
+            mean = (w[:, None] * probes).sum(axis=0)
+            mean /= max(np.linalg.norm(mean), 1e-12)
+            fused = self.score_many(mean)[1][0]
+        else:
+            raise ValueError(f"unknown MULTICAM_FUSION '{strategy}'")
+        col = int(np.argmax(fused))
+        return int(slots[col]), float(fused[col]), int(np.argmax(scores[:, col]))
+
+    def candidate(self, slot: int, score: float):
+        return self._parent._candidate(int(slot), float(score))
+
+    def is_expired(self, now=None):
+        if self.end_time is None:
+            return False
+        now = now or datetime.now(timezone.utc)
+        end = self.end_time
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        return end <= now
+
+    def is_marked(self, student_id) -> bool:
+        return student_id in self.marked_ids
+
+    def add_member(self, student_id):
+        with self._lock:
+            self.member_ids.add(student_id)
+            self._version = None
+
+    def mark(self, student_id):
+        self.marked_ids.add(student_id)
+
+
+def assign_one_to_one(scores, threshold):
+    """
+    Greedy one-to-one assignment on a (faces, students) score matrix:
+    repeatedly take the highest remaining pair at or above `threshold`
+    whose face and student are both still free. Returns a list of
+    (face_index, student_column, score).
+    """
+    faces, cols = np.nonzero(scores >= threshold)
+    order = np.argsort(-scores[faces, cols], kind="stable")
+    used_faces, used_cols, pairs = set(), set(), []
+    for i in order:
+        f, c = int(faces[i]), int(cols[i])
+        if f in used_faces or c in used_cols:
+            continue
+        used_faces.add(f)
+        used_cols.add(c)
+        pairs.append((f, c, float(scores[f, c])))
+    return pairs
+
+
+class SessionGalleryRegistry:
+    """Open SessionGallery objects keyed by session id."""
+
+    def __init__(self, parent=gallery):
+        self._parent = parent
+        self._lock = threading.Lock()
+        self._by_session = {}
+
+    def open(self, db, session):
+        """
+        Materialize the candidate gallery for `session` (enrolled students and
+        already-present records), replacing any previous one.
+        """
+        member_ids = [
+            uid
+            for (uid,) in db.query(CourseEnrollment.user_id)
+            .filter(CourseEnrollment.subject_id == session.subject_id)
+            .all()
+        ]
+        marked_ids = [
+            sid
+            for (sid,) in db.query(AttendanceRecord.student_id)
+            .filter(AttendanceRecord.session_id == session.id)
+            .all()
+        ]
+        sg = SessionGallery(
+            session.id,
+            session.subject_id,
+            session.end_time,
+            member_ids,
+            marked_ids,
+            parent=self._parent,
+        )
+        with self._lock:
+            self._prune_expired()
+            self._by_session[sg.session_id] = sg
+        return sg
+
+    def get(self, session_id):
+        with self._lock:
+            return self._by_session.get(str(session_id))
+
+    def get_or_open(self, db, session):
+        """Used by the kiosk so sessions started before a restart still work."""
+        return self.get(session.id) or self.open(db, session)
+
+    def drop(self, session_id):
+        with self._lock:
+            self._by_session.pop(str(session_id), None)
+
+    def add_member(self, subject_id, student_id):
+        """Propagate a new CourseEnrollment into every open gallery for the subject."""
+        with self._lock:
+            targets = [sg for sg in self._by_session.values() if sg.subject_id == subject_id]
+        for sg in targets:
+            sg.add_member(student_id)
+
+    def _prune_expired(self):
+        now = datetime.now(timezone.utc)
+        for key in [k for k, sg in self._by_session.items() if sg.is_expired(now)]:
+            del self._by_session[key]
+
+
+session_galleries = SessionGalleryRegistry()
@@ -0,0 +1,118 @@
+# backend/inference.py
+"""
+Executor that runs InsightFace work off the event loop.
+
+Each worker (thread or process, INFERENCE_EXECUTOR) owns its own
+FaceAnalysis instance via `face_service.get_face_app`, and at most
+INFERENCE_MAX_PENDING jobs may be queued or running at once; beyond that
+requests are rejected with 503 instead of piling up behind the detector.
+"""
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from fastapi import HTTPException
+
+from . import config
+
+
+def _warmup():
+    # imported lazily so the API process never loads models in process mode
+    from . import face_service
+
+    face_service.get_face_app()
+
+
+def _timed_call(fn, args, kwargs):
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time(), result
+
+
+class InferencePool:
+    def __init__(self, kind=None, workers=None, max_pending=None):
+        self.kind = kind or config.INFERENCE_EXECUTOR
+        self.workers = workers or config.INFERENCE_WORKERS
+        self.max_pending = max_pending or config.INFERENCE_MAX_PENDING
+        self._executor = None
+
+        self.pending = 0  # queued + running
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self.max_wait = 0.0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warmup,
+            )
+        elif self.kind == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="inference",
+                initializer=_warmup,
+            )
+        else:
+            raise ValueError(f"unknown INFERENCE_EXECUTOR '{self.kind}'")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` on a worker and await its result. `fn` must
+        be a module-level function when the process executor is used.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="inference queue full, retry shortly")
+
+        self.start()
+        self.pending += 1
+        submitted = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            started, finished, result = await loop.run_in_executor(
+                self._executor, _timed_call, fn, args, kwargs
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+        wait = max(0.0, started - submitted)
+        self.completed += 1
+        self._wait_total += wait
+        self._run_total += finished - started
+        self.max_wait = max(self.max_wait, wait)
+        return result
+
+    def stats(self):
+        done = max(self.completed, 1)
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "in_flight": self.pending,
+            "queue_depth": max(0, self.pending - self.workers),
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "avg_wait_ms": round(self._wait_total / done * 1000, 2),
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "avg_run_ms": round(self._run_total / done * 1000, 2),
+        }
+
+
+pool = InferencePool()
@@ -1,18 +1,62 @@
 # backend/main.py
+import logging
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from .db import init_db
+from .db import init_db, SessionLocal
+from .gallery import gallery
+from .inference import pool as inference_pool
+from .probe_writer import probe_writer
+from .tracker import trackers
+from .attendance_writer import attendance_buffer
+from .session_cache import active_sessions
+from . import face_service
 from .routers import auth as auth_router
 from .routers import admin as admin_router
 from .routers import subjects as subjects_router
 from .routers import sessions as sessions_router
 from .routers import kiosk as kiosk_router
 from .routers import attendance as attendance_router
+from .routers import analytics as analytics_router
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Face Attendance API")
 init_db()
 
+
+@app.on_event("startup")
+def on_startup():
+    # build the in-memory gallery once; routers keep it up to date
+    db = SessionLocal()
+    try:
+        gallery.build(db)
+    finally:
+        db.close()
+    # spin up inference workers (each loads its own FaceAnalysis)
+    inference_pool.start()
+    probe_writer.start()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # persist matrix + search index so the next start can memory-map them;
+    # a failed snapshot only costs a rebuild at the next start, so it must
+    # not keep the writers below from flushing
+    db = SessionLocal()
+    try:
+        gallery.snapshot(db)
+    except Exception:
+        logger.exception("gallery snapshot failed")
+    finally:
+        db.close()
+    inference_pool.shutdown()
+    # flush probe images and buffered attendance still waiting to be written
+    probe_writer.shutdown()
+    attendance_buffer.flush_sync()
+
+
 # CORS setup
 origins = [
     "http://localhost:3000",
@@ -25,6 +69,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # keyset pagination cursor of list endpoints (see pagination.py)
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers (all paths remain identical)
@@ -34,3 +80,17 @@ app.include_router(subjects_router.router)
 app.include_router(sessions_router.router)
 app.include_router(kiosk_router.router)
 app.include_router(attendance_router.router)
+app.include_router(analytics_router.router)
+
+
+@app.get("/api/inference/stats")
+def inference_stats():
+    # queue depth / wait times of the face inference executor, for monitoring
+    return {
+        **inference_pool.stats(),
+        "batching": face_service.batcher.stats(),
+        "probe_writes": probe_writer.stats(),
+        "tracking": trackers.stats(),
+        "attendance_writes": attendance_buffer.stats(),
+        "active_sessions": active_sessions.stats(),
+    }
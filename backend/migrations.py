@@ -0,0 +1,175 @@
+# backend/migrations.py
+"""
+Small, idempotent schema migrations for databases created before a model
+change. `Base.metadata.create_all` only creates missing tables, so column /
+type / index changes on existing tables are applied here.
+
+Run automatically from `init_db()`, or by hand:
+
+    python -m backend.migrations
+"""
+import logging
+
+from sqlalchemy import inspect, text, LargeBinary
+from sqlalchemy.orm import Session
+
+from .analytics import rebuild_rollups
+from .embeddings import encode_embedding
+from .face_templates import rebuild_templates
+from .models import AttendanceRecord, ClassSession, CourseEnrollment, FaceEmbedding
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def _columns(conn, table):
+    insp = inspect(conn)
+    if not insp.has_table(table):
+        return {}
+    return {c["name"]: c for c in insp.get_columns(table)}
+
+
+# ---------- Migrations ----------
+
+def face_embeddings_binary(conn):
+    """
+    Convert face_embeddings.embedding from a JSON float list to packed
+    float32/float16 bytes. Existing rows are re-encoded in batches.
+    """
+    cols = _columns(conn, "face_embeddings")
+    if "embedding" not in cols:
+        return
+    if isinstance(cols["embedding"]["type"], LargeBinary) and "embedding_json" not in cols:
+        return
+
+    blob_type = LargeBinary().compile(dialect=conn.dialect)
+    if "embedding_json" not in cols:
+        conn.execute(text("ALTER TABLE face_embeddings RENAME COLUMN embedding TO embedding_json"))
+        conn.execute(text(f"ALTER TABLE face_embeddings ADD COLUMN embedding {blob_type}"))
+
+    while True:
+        rows = conn.execute(
+            text(
+                "SELECT id, embedding_json FROM face_embeddings "
+                "WHERE embedding IS NULL LIMIT :n"
+            ),
+            {"n": BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            text("UPDATE face_embeddings SET embedding = :blob WHERE id = :id"),
+            [{"id": r.id, "blob": encode_embedding(r.embedding_json)} for r in rows],
+        )
+
+    conn.execute(text("ALTER TABLE face_embeddings ALTER COLUMN embedding SET NOT NULL"))
+    conn.execute(text("ALTER TABLE face_embeddings DROP COLUMN embedding_json"))
+
+
+def face_templates_backfill(conn):
+    """Build FaceTemplate rows for embeddings stored before the table existed."""
+    has_templates = conn.execute(text("SELECT 1 FROM face_templates LIMIT 1")).first()
+    has_embeddings = conn.execute(text("SELECT 1 FROM face_embeddings LIMIT 1")).first()
+    if has_templates or not has_embeddings:
+        return
+    rebuild_templates(Session(bind=conn))
+
+
+def _add_unique(conn, table, name, columns, keep_order):
+    """
+    Add a unique constraint if missing, first deleting duplicate rows
+    (keeping the first by `keep_order`).
+    """
+    insp = inspect(conn)
+    if not insp.has_table(table):
+        return
+    if name in {c["name"] for c in insp.get_unique_constraints(table)}:
+        return
+    cols = ", ".join(columns)
+    conn.execute(
+        text(
+            f"DELETE FROM {table} WHERE id IN ("
+            f"SELECT id FROM (SELECT id, row_number() OVER ("
+            f"PARTITION BY {cols} ORDER BY {keep_order}) AS rn "
+            f"FROM {table}) d WHERE d.rn > 1)"
+        )
+    )
+    conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE ({cols})"))
+
+
+def attendance_unique(conn):
+    """
+    Enforce one attendance_records row per (session_id, student_id):
+    delete duplicates (keeping the earliest) and add the unique constraint.
+    """
+    _add_unique(
+        conn, "attendance_records", "uq_attendance_session_student",
+        ("session_id", "student_id"), "timestamp NULLS LAST, id",
+    )
+
+
+def hot_path_indexes(conn):
+    """
+    Indexes for the per-frame / polling lookups (see scripts/explain_queries.py):
+    one enrollment per (user, subject), and every Index declared on the
+    models that an older database does not have yet.
+    """
+    _add_unique(
+        conn, "course_enrollments", "uq_course_enrollment_user_subject",
+        ("user_id", "subject_id"), "id",
+    )
+    insp = inspect(conn)
+    for table in (FaceEmbedding.__table__, CourseEnrollment.__table__,
+                  ClassSession.__table__, AttendanceRecord.__table__):
+        if insp.has_table(table.name):
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def attendance_rollups_backfill(conn):
+    """Roll up sessions that ended before the rollup tables existed."""
+    has_rollups = conn.execute(text("SELECT 1 FROM session_rollups LIMIT 1")).first()
+    has_sessions = conn.execute(text("SELECT 1 FROM class_sessions LIMIT 1")).first()
+    if has_rollups or not has_sessions:
+        return
+    rebuild_rollups(Session(bind=conn))
+
+
+MIGRATIONS = [
+    ("0001_face_embeddings_binary", face_embeddings_binary),
+    ("0002_face_templates_backfill", face_templates_backfill),
+    ("0003_attendance_unique", attendance_unique),
+    ("0004_hot_path_indexes", hot_path_indexes),
+    ("0005_attendance_rollups_backfill", attendance_rollups_backfill),
+]
+
+
+# ---------- Runner ----------
+
+def run_migrations(engine):
+    """Apply every migration not yet recorded in schema_migrations."""
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "name VARCHAR(128) PRIMARY KEY, "
+                "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+            )
+        )
+        applied = {r[0] for r in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+    for name, fn in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(text("INSERT INTO schema_migrations (name) VALUES (:name)"), {"name": name})
+        logger.info("applied migration %s", name)
+
+
+if __name__ == "__main__":
+    from .db import engine
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    run_migrations(engine)
@@ -2,7 +2,8 @@
 import enum
 import uuid
 from sqlalchemy import (
-    Column, String, Integer, DateTime, Enum, Boolean, ForeignKey, Text, JSON
+    Column, String, Integer, DateTime, Enum, Boolean, ForeignKey, Text, LargeBinary,
+    UniqueConstraint, Index, text,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, declarative_base
@@ -37,22 +38,47 @@ class Subject(Base):
 
 class CourseEnrollment(Base):
     __tablename__ = "course_enrollments"
+    __table_args__ = (
+        # also serves "subjects of a user" (leading column)
+        UniqueConstraint("user_id", "subject_id", name="uq_course_enrollment_user_subject"),
+        # "students of a subject": session galleries
+        Index("ix_course_enrollments_subject_id", "subject_id"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"))
     subject_id = Column(UUID(as_uuid=True), ForeignKey("subjects.id", ondelete="CASCADE"))
 
 class FaceEmbedding(Base):
     __tablename__ = "face_embeddings"
+    __table_args__ = (
+        Index("ix_face_embeddings_user_id", "user_id"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"))
-    embedding = Column(JSON, nullable=False)  # store as JSON list of floats
+    embedding = Column(LargeBinary, nullable=False)  # packed float32/float16, see embeddings.py
     image_path = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="embeddings")
 
+class FaceTemplate(Base):
+    __tablename__ = "face_templates"
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    centroid = Column(LargeBinary, nullable=False)  # L2-normalized float32 mean
+    running_sum = Column(LargeBinary, nullable=False)  # float64 sum of all samples
+    sample_count = Column(Integer, nullable=False, default=0)
+    prototypes = Column(LargeBinary, nullable=True)  # k x dim float32 medoids (optional)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class ClassSession(Base):
     __tablename__ = "class_sessions"
+    __table_args__ = (
+        # /api/sessions/active polls and the one-active-session-per-faculty
+        # check only ever look at active sessions, a small slice of the table
+        Index("ix_class_sessions_active_end", "end_time", postgresql_where=text("is_active")),
+        Index("ix_class_sessions_active_faculty", "faculty_id", "end_time", postgresql_where=text("is_active")),
+        Index("ix_class_sessions_subject_id", "subject_id"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     subject_id = Column(UUID(as_uuid=True), ForeignKey("subjects.id", ondelete="SET NULL"))
     faculty_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"))
@@ -62,6 +88,12 @@ class ClassSession(Base):
 
 class AttendanceRecord(Base):
     __tablename__ = "attendance_records"
+    __table_args__ = (
+        # one record per student per session; kiosk inserts use ON CONFLICT DO NOTHING
+        UniqueConstraint("session_id", "student_id", name="uq_attendance_session_student"),
+        # a student's history across sessions (the constraint covers per-session lookups)
+        Index("ix_attendance_records_student_id", "student_id"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     session_id = Column(UUID(as_uuid=True), ForeignKey("class_sessions.id", ondelete="CASCADE"))
     student_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"))
@@ -69,3 +101,30 @@ class AttendanceRecord(Base):
     status = Column(String(32), default="PRESENT")  # 'PRESENT' or 'LATE'
     confidence = Column(String(32), nullable=True)
     image_path = Column(String, nullable=True)
+
+class SessionRollup(Base):
+    # per-session headcount, precomputed when the session ends (analytics.py)
+    __tablename__ = "session_rollups"
+    __table_args__ = (
+        Index("ix_session_rollups_subject_start", "subject_id", "start_time"),
+    )
+    session_id = Column(UUID(as_uuid=True), ForeignKey("class_sessions.id", ondelete="CASCADE"), primary_key=True)
+    subject_id = Column(UUID(as_uuid=True), ForeignKey("subjects.id", ondelete="CASCADE"), nullable=True)
+    start_time = Column(DateTime(timezone=True), nullable=False)
+    enrolled = Column(Integer, nullable=False, default=0)  # students enrolled in the subject when rolled up
+    present = Column(Integer, nullable=False, default=0)  # attendance records (PRESENT + LATE)
+    late = Column(Integer, nullable=False, default=0)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class StudentSubjectRollup(Base):
+    # per-student attendance over a subject's rolled-up sessions (analytics.py)
+    __tablename__ = "student_subject_rollups"
+    __table_args__ = (
+        Index("ix_student_subject_rollups_subject_id", "subject_id"),
+    )
+    student_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    subject_id = Column(UUID(as_uuid=True), ForeignKey("subjects.id", ondelete="CASCADE"), primary_key=True)
+    attended = Column(Integer, nullable=False, default=0)  # rolled-up sessions of the subject attended
+    late = Column(Integer, nullable=False, default=0)
+    last_attended = Column(DateTime(timezone=True), nullable=True)
+    refreshed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,49 @@
+# backend/pagination.py
+"""
+Opaque keyset cursors for list endpoints.
+
+List endpoints keep returning a plain JSON list; when there may be more
+rows, the cursor for the next page is sent in the X-Next-Cursor header
+and passed back as `?cursor=`. A cursor is the sort key of the last row
+on the page (urlsafe base64 of a JSON list), so the next page is a range
+scan on the index instead of an OFFSET over everything before it.
+"""
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([_plain(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    """Decode a cursor into the sort key, converting each value with `types`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if len(values) != len(types):
+            raise ValueError("wrong cursor length")
+        return tuple(t(v) for t, v in zip(types, values))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def set_next_cursor(response, rows, limit, key):
+    """Set X-Next-Cursor from the last row when the page came back full."""
+    if len(rows) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(rows[-1]))
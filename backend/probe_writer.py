@@ -0,0 +1,182 @@
+# backend/probe_writer.py
+"""
+Deferred persistence of kiosk probe images.
+
+Kiosk endpoints ask `plan()` up front whether the outcome's probe is
+kept and under which storage key (it only depends on the frame bytes,
+see file_store.py), so `AttendanceRecord.image_path` can be stored
+immediately -- or left empty when the probe will not be written -- then
+hand the frame to `submit()`, whose background thread writes it after
+the response has gone out. Probes a committed row refers to go through
+`submit_required()` instead: when the queue is full they are written in
+a worker thread (never on the event loop) instead of dropped. Which
+outcomes are kept at all is a policy:
+
+- PROBE_KEEP: outcomes always written (default "matched")
+- PROBE_UNRESOLVED_SAMPLE_RATE: fraction of unresolved probes kept for review
+- PROBE_CROP_ONLY: store only the detected face (with margin) instead of the frame
+"""
+import asyncio
+import logging
+import queue
+import random
+import threading
+
+import cv2
+
+from . import config
+from .face_service import decode_image
+from .file_store import store
+
+logger = logging.getLogger(__name__)
+
+
+class ProbeWriter:
+    def __init__(self, keep=None, unresolved_rate=None, crop_only=None, max_queue=None):
+        self.keep = set(config.PROBE_KEEP if keep is None else keep)
+        self.unresolved_rate = config.PROBE_UNRESOLVED_SAMPLE_RATE if unresolved_rate is None else unresolved_rate
+        self.crop_only = config.PROBE_CROP_ONLY if crop_only is None else crop_only
+        self._queue = queue.Queue(maxsize=config.PROBE_QUEUE_MAX if max_queue is None else max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.written = 0
+        self.skipped = 0
+        self.dropped = 0  # queue full
+        self.inline = 0  # required probes written outside the queue because it was full
+        self.failed = 0
+
+    # ---------- Policy ----------
+
+    def key_for(self, frame, bbox=None) -> str:
+        """
+        Storage key of a frame's probe. Crops are keyed by the hash of the
+        frame they were cut from plus the face box, and always re-encoded
+        as JPEG.
+        """
+        if self.crop_only:
+            return store.key_for("crops", frame.data + repr(tuple(bbox or ())).encode(), ".jpg")
+        return store.key_for("probes", frame.data, frame.ext)
+
+    def should_keep(self, status) -> bool:
+        if status in self.keep:
+            return True
+        return status == "unresolved" and random.random() < self.unresolved_rate
+
+    def plan(self, frame, status, bbox=None):
+        """
+        Storage key the probe of this outcome will be written under, or None
+        when the policy drops it. Decide this before referencing the probe
+        from a row or a response.
+        """
+        if not self.should_keep(status):
+            self.skipped += 1
+            return None
+        if self.crop_only and bbox is None:
+            # nothing to crop; don't fall back to storing the full frame
+            self.skipped += 1
+            return None
+        return self.key_for(frame, bbox)
+
+    # ---------- Queue ----------
+
+    def _item(self, frame, key, bbox):
+        # queue only what the writer needs: the decoded array is kept for
+        # cropping when already available, the compressed bytes otherwise
+        image = frame._image if self.crop_only else None
+        return (frame.data, image, bbox, key)
+
+    def submit(self, frame, key, bbox=None) -> bool:
+        """
+        Queue `frame` to be stored under `key` (from `plan`). Returns whether
+        the probe will be written: a full queue drops it.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait(self._item(frame, key, bbox))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    async def submit_required(self, frame, key, bbox=None) -> bool:
+        """
+        `submit` for a probe a committed row already points at: on a full
+        queue it is written right away in a worker thread, not dropped.
+        Returns False only if that write failed.
+        """
+        item = self._item(frame, key, bbox)
+        self.start()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        try:
+            await asyncio.to_thread(self._write, *item)
+        except Exception:
+            self.failed += 1
+            logger.exception("probe write failed for %s", key)
+            return False
+        self.written += 1
+        self.inline += 1
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="probe-writer", daemon=True)
+                self._thread.start()
+
+    def shutdown(self, timeout=10):
+        """Flush pending probes and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write(*item)
+                self.written += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("probe write failed for %s", item[3])
+
+    def _write(self, data, image, bbox, key):
+        if store.exists(key):
+            store.touch(key)  # same frame submitted again
+            return
+        if self.crop_only:
+            data = _encode_crop(image if image is not None else decode_image(data), bbox)
+        store.write(key, data)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "written_inline": self.inline,
+            "failed": self.failed,
+        }
+
+
+def _encode_crop(img, bbox, margin=None):
+    margin = config.PROBE_CROP_MARGIN if margin is None else margin
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = bbox
+    mx, my = int((x2 - x1) * margin), int((y2 - y1) * margin)
+    crop = img[max(0, y1 - my):min(h, y2 + my), max(0, x1 - mx):min(w, x2 + mx)]
+    ok, buf = cv2.imencode(".jpg", crop)
+    if not ok:
+        raise ValueError("could not encode probe crop")
+    return buf.tobytes()
+
+
+probe_writer = ProbeWriter()
@@ -1,4 +1,4 @@
 # backend/routers/__init__.py
-from . import auth, admin, subjects, sessions, kiosk, attendance
+from . import auth, admin, subjects, sessions, kiosk, attendance, analytics
 
-__all__ = ["auth", "admin", "subjects", "sessions", "kiosk", "attendance"]
+__all__ = ["auth", "admin", "subjects", "sessions", "kiosk", "attendance", "analytics"]
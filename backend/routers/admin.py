@@ -1,11 +1,13 @@
 # backend/routers/admin.py
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
-import base64
+from typing import List, Optional
+from uuid import UUID
+import zipfile
 from sqlalchemy import func
 
+from ..db import SessionLocal
 from ..deps import get_db
 from ..models import (
     User,
@@ -15,8 +17,15 @@ from ..models import (
     CourseEnrollment,
 )
 from ..schemas import UserCreate, UserOut
+from ..pagination import decode_cursor, set_next_cursor
 from ..auth import hash_password
-from .. import face_service, config
+from ..gallery import gallery, session_galleries
+from ..embeddings import encode_embedding
+from ..face_templates import add_samples
+from ..file_store import store
+from ..bulk_enroll import ArchiveSource, Journal, archive_digest, enroll_archive, summarize
+from ..inference import pool as inference_pool
+from .. import face_service, config, user_queries
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
@@ -47,33 +56,32 @@ def create_user(in_user: UserCreate, db: Session = Depends(get_db)):
     db.add(user)
     db.commit()
     db.refresh(user)
+    gallery.register_user(user)
     return user
 
 
 @router.get("/users")
-def list_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = db.query(User).offset(skip).limit(limit).all()
-
-    # 🔹 Precompute face-embedding counts per user_id
-    face_counts = dict(
-        db.query(FaceEmbedding.user_id, func.count(FaceEmbedding.id))
-        .group_by(FaceEmbedding.user_id)
-        .all()
-    )
-
-    result = []
-    for u in users:
-        base = UserOut.from_orm(u).dict()
-
-        enrolls = db.query(CourseEnrollment).filter_by(user_id=u.id).all()
-        base["subject_ids"] = [str(e.subject_id) for e in enrolls]
-
-        # 🔹 This is NOT a DB column, just an extra field in the response
-        base["face_image_count"] = int(face_counts.get(u.id, 0))
-
-        result.append(base)
+def list_users(
+    response: Response,
+    role: Optional[RoleEnum] = None,
+    semester: Optional[int] = None,
+    subject_id: Optional[UUID] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    # keyset pagination: the next page's cursor comes back in X-Next-Cursor
+    after = decode_cursor(cursor, UUID)[0] if cursor else None
+    rows = user_queries.users_page(
+        db, role=role, semester=semester, subject_id=subject_id, after=after, limit=limit
+    ).all()
+    set_next_cursor(response, rows, limit, key=lambda row: (row[0].id,))
 
-    return result
+    return [
+        # face_image_count is NOT a DB column, just an extra field in the response
+        {**user_queries.user_payload(u, subject_ids), "face_image_count": int(face_count or 0)}
+        for u, subject_ids, face_count in rows
+    ]
 
 
 @router.post("/train-face")
@@ -89,36 +97,76 @@ async def train_face(
             detail=f"user with enrollment_no '{enrollment_no}' not found",
         )
 
-    accepted = 0
-    rejected = 0
+    frames, raw_keys = [], []
     for up in files:
         content = await up.read()
-        ts = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-        raw_path = config.RAW_DIR / f"{enrollment_no}_{ts}_{up.filename}"
-        raw_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(raw_path, "wb") as f:
-            f.write(content)
-
-        b64 = base64.b64encode(content).decode("utf-8")
-        embedding, bbox = face_service.get_embedding_from_b64(b64)
-        if embedding is None:
-            rejected += 1
+        frame = face_service.Frame(content)
+        # identical re-uploads are stored once (content-addressed)
+        raw_keys.append(await run_in_threadpool(store.put, "raw", content, frame.ext))
+        frames.append(frame)
+
+    # quality-gate and embed all uploaded images in one inference job
+    results = await inference_pool.run(face_service.enrollment_embeddings, frames)
+
+    new_embeddings = []
+    rejected_reasons = {}
+    for raw_key, res in zip(raw_keys, results):
+        if res["embedding"] is None:
+            rejected_reasons[res["reason"]] = rejected_reasons.get(res["reason"], 0) + 1
             continue
-
-        fe = FaceEmbedding(
-            user_id=user.id, embedding=embedding, image_path=str(raw_path)
-        )
-        db.add(fe)
-        accepted += 1
-
+        db.add(FaceEmbedding(
+            user_id=user.id,
+            embedding=encode_embedding(res["embedding"]),
+            image_path=store.uri(raw_key),
+        ))
+        new_embeddings.append(res["embedding"])
+
+    pruned = 0
+    if new_embeddings:
+        template, pruned = add_samples(db, user.id, new_embeddings)
+        sample_count = template.sample_count
+    else:
+        template = None
+        sample_count = db.query(func.count(FaceEmbedding.id)).filter_by(user_id=user.id).scalar()
     db.commit()
+    if template is not None:
+        gallery.upsert_template(user, template)
     return {
-        "accepted": accepted,
-        "rejected": rejected,
+        "accepted": len(new_embeddings),
+        "rejected": len(frames) - len(new_embeddings),
+        "rejected_reasons": rejected_reasons,
+        "pruned": pruned,
+        "sample_count": sample_count,
+        "min_samples": config.MIN_SAMPLES_PER_STUDENT,
+        "complete": sample_count >= config.MIN_SAMPLES_PER_STUDENT,
         "enrollment_no": enrollment_no,
     }
 
 
+@router.post("/bulk-enroll")
+async def bulk_enroll(archive: UploadFile = File(...)):
+    """
+    Enroll many students from one ZIP laid out as enrollment_no/*.jpg.
+    Uploading the same archive again after an interruption resumes it.
+    All blocking steps run in worker threads, each DB step with its own
+    Session, so kiosks on this worker keep being served meanwhile.
+    """
+    job_id = await run_in_threadpool(archive_digest, archive.file)
+    try:
+        source = await run_in_threadpool(ArchiveSource, archive.file)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="archive is not a valid ZIP file")
+
+    try:
+        journal = await run_in_threadpool(Journal, config.BULK_JOBS_DIR / f"{job_id}.jsonl")
+        reports = await enroll_archive(
+            SessionLocal, source, inference_pool, journal, on_template=gallery.upsert_template
+        )
+    finally:
+        source.close()
+    return {"job_id": job_id, "summary": summarize(reports), "students": reports}
+
+
 @router.post("/subjects")
 def create_subject(
     name: str = Form(...), code: str = Form(...), db: Session = Depends(get_db)
@@ -166,6 +214,7 @@ def enroll_subject(
     db.add(ce)
     db.commit()
     db.refresh(ce)
+    session_galleries.add_member(subject.id, user.id)
 
     return {
         "status": "enrolled",
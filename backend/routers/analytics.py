@@ -0,0 +1,54 @@
+# backend/routers/analytics.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import datetime
+from uuid import UUID
+
+from ..deps import get_db
+from ..models import ClassSession
+from .. import analytics
+
+router = APIRouter(prefix="/api/analytics", tags=["analytics"])
+
+
+@router.get("/students")
+def student_attendance(
+    student_id: Optional[UUID] = None,
+    subject_id: Optional[UUID] = None,
+    db: Session = Depends(get_db),
+):
+    """Attendance percentage per enrolled student per subject."""
+    return analytics.student_subject_stats(db, student_id=student_id, subject_id=subject_id)
+
+
+@router.get("/sessions")
+def session_headcounts(
+    subject_id: Optional[UUID] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    """Headcount of ended sessions, newest first."""
+    return analytics.session_stats(db, subject_id=subject_id, since=since, until=until, limit=limit)
+
+
+@router.get("/sessions/{session_id}")
+def session_headcount(session_id: UUID, db: Session = Depends(get_db)):
+    """Headcount of one session; counted live while it is still running."""
+    cs = db.query(ClassSession).filter_by(id=session_id).first()
+    if not cs:
+        raise HTTPException(status_code=404, detail="session not found")
+    return analytics.live_session_stats(db, cs)
+
+
+@router.get("/subjects")
+def subject_attendance(
+    subject_id: Optional[UUID] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+):
+    """Sessions, headcount totals and average attendance per subject over a date range."""
+    return analytics.subject_stats(db, subject_id=subject_id, since=since, until=until)
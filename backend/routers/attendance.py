@@ -1,27 +1,57 @@
 # backend/routers/attendance.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Response
 from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.orm import Session
 from typing import Optional
+from datetime import datetime, timezone
+from uuid import UUID
 import io
 import csv
 
+from ..db import SessionLocal
 from ..deps import get_db
-from ..models import AttendanceRecord
+from ..models import AttendanceRecord, ClassSession, User
+from ..pagination import decode_cursor, set_next_cursor
 
 router = APIRouter(prefix="/api/attendance", tags=["attendance"])
 
+EXPORT_CHUNK_ROWS = 2000  # rows per server-side cursor fetch / CSV chunk
+# records without a timestamp sort (and page) as if made at the epoch
+NO_TIMESTAMP = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 
 @router.get("")
 def list_attendance(
-    session_id: Optional[str] = None,
+    response: Response,
+    session_id: Optional[UUID] = None,
+    student_id: Optional[UUID] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
     db: Session = Depends(get_db),
 ):
-    q = db.query(AttendanceRecord)
+    # keyset pagination on (timestamp, id), oldest first: the next page's
+    # cursor comes back in X-Next-Cursor
+    sort_ts = func.coalesce(AttendanceRecord.timestamp, NO_TIMESTAMP)
+    q = select(
+        AttendanceRecord.id,
+        AttendanceRecord.session_id,
+        AttendanceRecord.student_id,
+        AttendanceRecord.timestamp,
+        AttendanceRecord.status,
+        AttendanceRecord.confidence,
+        sort_ts.label("sort_ts"),
+    )
     if session_id:
-        q = q.filter(AttendanceRecord.session_id == session_id)
+        q = q.where(AttendanceRecord.session_id == session_id)
+    if student_id:
+        q = q.where(AttendanceRecord.student_id == student_id)
+    if cursor:
+        after = decode_cursor(cursor, datetime.fromisoformat, UUID)
+        q = q.where(tuple_(sort_ts, AttendanceRecord.id) > after)
 
-    rows = q.all()
+    rows = db.execute(q.order_by(sort_ts, AttendanceRecord.id).limit(limit)).all()
+    set_next_cursor(response, rows, limit, key=lambda r: (r.sort_ts, r.id))
     return [
         {
             "id": str(r.id),
@@ -36,33 +66,71 @@ def list_attendance(
 
 
 @router.get("/export")
-def export_attendance(session_id: str, db: Session = Depends(get_db)):
-    rows = db.query(AttendanceRecord).filter_by(session_id=session_id).all()
+def export_attendance(
+    session_id: Optional[UUID] = None,
+    subject_id: Optional[UUID] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """
+    CSV of attendance records for one session, or for a subject and/or a
+    time range (e.g. a whole term). Rows are streamed from a server-side
+    cursor as plain tuples, EXPORT_CHUNK_ROWS at a time, so memory use
+    does not grow with the export.
+    """
+    q = (
+        select(
+            AttendanceRecord.student_id,
+            AttendanceRecord.timestamp,
+            AttendanceRecord.status,
+            AttendanceRecord.confidence,
+            User.enrollment_no,
+            User.full_name,
+            AttendanceRecord.session_id,
+        )
+        .join(User, User.id == AttendanceRecord.student_id)
+        .order_by(AttendanceRecord.session_id, AttendanceRecord.timestamp, AttendanceRecord.id)
+    )
+    if session_id:
+        q = q.where(AttendanceRecord.session_id == session_id)
+    if subject_id:
+        q = q.join(ClassSession, ClassSession.id == AttendanceRecord.session_id).where(
+            ClassSession.subject_id == subject_id
+        )
+    if since:
+        q = q.where(AttendanceRecord.timestamp >= since)
+    if until:
+        q = q.where(AttendanceRecord.timestamp < until)
 
     def iter_csv():
         buffer = io.StringIO()
         writer = csv.writer(buffer)
-        writer.writerow(["student_id", "timestamp", "status", "confidence"])
+        writer.writerow(
+            ["student_id", "timestamp", "status", "confidence", "enrollment_no", "full_name", "session_id"]
+        )
         yield buffer.getvalue()
         buffer.seek(0)
         buffer.truncate(0)
-        for r in rows:
-            writer.writerow(
-                [
-                    str(r.student_id),
-                    r.timestamp.isoformat(),
-                    r.status,
-                    r.confidence,
-                ]
-            )
-            yield buffer.getvalue()
-            buffer.seek(0)
-            buffer.truncate(0)
+        # own DB session: the request's one is closed before the body streams
+        with SessionLocal() as db:
+            result = db.execute(q.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+            for chunk in result.partitions():
+                writer.writerows(
+                    [
+                        str(student), ts.isoformat() if ts else "", status, confidence,
+                        enrollment_no, full_name, str(session),
+                    ]
+                    for student, ts, status, confidence, enrollment_no, full_name, session in chunk
+                )
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
 
+    name = session_id or subject_id or "all"
     return StreamingResponse(
         iter_csv(),
         media_type="text/csv",
         headers={
-            "Content-Disposition": f"attachment; filename=attendance_{session_id}.csv"
+            "Content-Disposition": f"attachment; filename=attendance_{name}.csv"
         },
     )
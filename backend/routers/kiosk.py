@@ -1,21 +1,20 @@
 # backend/routers/kiosk.py
-from fastapi import APIRouter, Depends, HTTPException, Form, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Form, UploadFile, File, Request, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
-import base64
+from typing import List, Optional
+import asyncio
+
 import numpy as np
 
+from ..db import SessionLocal
 from ..deps import get_db
-from ..models import (
-    User,
-    RoleEnum,
-    FaceEmbedding,
-    ClassSession,
-    AttendanceRecord,
-    CourseEnrollment,
-)
+from ..attendance_writer import attendance_row, record_attendance
+from ..gallery import session_galleries, assign_one_to_one
+from ..session_cache import active_sessions
+from ..inference import pool as inference_pool
+from ..probe_writer import probe_writer
+from ..tracker import trackers
+from ..file_store import store
 from .. import face_service, config
 
 router = APIRouter(prefix="/api/kiosk", tags=["kiosk"])
@@ -23,90 +22,222 @@ router = APIRouter(prefix="/api/kiosk", tags=["kiosk"])
 
 @router.post("/mark-attendance")
 async def kiosk_mark_attendance(
+    request: Request,
     session_id: str = Form(...),
     imageBase64: str = Form(...),
+    kiosk_id: Optional[str] = Form(None),
     db: Session = Depends(get_db),
 ):
-    session = db.query(ClassSession).filter_by(id=session_id).first()
+    session = active_sessions.get(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="session not found")
 
-    ts = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-    probe_path = config.PROBES_DIR / f"{session_id}_{ts}.jpg"
-
+    # decode base64 once; the frame carries both the original bytes (for the
+    # probe file) and, after detection, the decoded array
     try:
-        face_service.save_probe_image_from_b64(imageBase64, probe_path)
-    except Exception:
+        frame = face_service.Frame.from_b64(imageBase64)
+    except ValueError:
+        frame = None
+    if not frame or not frame.data:
         raise HTTPException(
             status_code=400,
             detail="Invalid imageBase64 data (not valid base64 image)",
         )
 
-    embedding, bbox = face_service.get_embedding_from_b64(imageBase64)
+    return await _recognize_frame(db, session, frame, kiosk_id, _kiosk_key(request, kiosk_id))
+
+
+@router.post("/mark-attendance-binary")
+async def kiosk_mark_attendance_binary(
+    request: Request,
+    session_id: str,
+    kiosk_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Single-frame variant taking the raw JPEG/PNG bytes as the request body
+    (session_id / kiosk_id as query parameters), skipping base64 entirely.
+    """
+    session = active_sessions.get(db, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="session not found")
+
+    content = await request.body()
+    if not content:
+        raise HTTPException(status_code=400, detail="empty image body")
+
+    return await _recognize_frame(
+        db, session, face_service.Frame(content), kiosk_id, _kiosk_key(request, kiosk_id)
+    )
+
+
+def _kiosk_key(request: Request, kiosk_id):
+    """Tracker identity of the calling kiosk; the frontend does not send kiosk_id."""
+    return kiosk_id or (request.client.host if request.client else "unknown")
+
+
+async def _recognize_frame(db, session, frame, kiosk_id, kiosk_key):
+    """
+    Embed the largest face and match it. Faces overlapping a track this
+    kiosk has already resolved skip recognition (see tracker.py).
+    """
+    tracker = trackers.get(session.id, kiosk_key) if config.TRACKING_ENABLED else None
+    skip_boxes = tracker.resolved_boxes() if tracker else None
+    trackers.frames += 1
+    try:
+        embedding, bbox = await face_service.batcher.embed(frame, kiosk_id, skip_boxes)
+        if embedding is None and bbox is not None:
+            cached = tracker.follow(bbox)
+            if cached is not None:
+                trackers.skipped += 1
+                return cached
+            # the track expired while the frame was in flight
+            embedding, bbox = await face_service.batcher.embed(frame, kiosk_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image data (could not decode)")
     if embedding is None:
-        return JSONResponse({"status": "no_face"}, status_code=200)
+        return {"status": "no_face"}
 
-    students = db.query(User).filter(User.role == RoleEnum.STUDENT).all()
+    result = await _match_and_mark(db, session, embedding, frame, bbox)
+    if tracker:
+        tracker.observe(bbox, embedding, result)
+    return result
 
-    probe_vec = np.array(embedding)
-    best = {"student_id": None, "score": -1.0, "name": None, "enrollment_no": None}
-    for s in students:
-        embs = db.query(FaceEmbedding).filter_by(user_id=s.id).all()
-        if not embs:
-            continue
-        mat = np.array([e.embedding for e in embs])
-        centroid = mat.mean(axis=0)
-        denom = np.linalg.norm(centroid)
-        if denom == 0:
-            continue
-        c_norm = centroid / denom
-        score = float(np.dot(probe_vec, c_norm))
-        if score > best["score"]:
-            best = {
-                "student_id": s.id,
-                "score": score,
-                "name": s.full_name,
-                "enrollment_no": s.enrollment_no,
-            }
 
-    if best["student_id"] is None:
+@router.websocket("/stream")
+async def kiosk_stream(
+    websocket: WebSocket,
+    session_id: str,
+    kiosk_id: Optional[str] = None,
+):
+    """
+    Streaming kiosk: binds to one active ClassSession when connecting, then
+    takes raw JPEG/PNG frames as binary messages and pushes one JSON event
+    per processed frame ({"type": "result", "status": ..., ...}, same
+    fields as /mark-attendance).
+
+    Frames that arrive while one is being recognized replace the waiting
+    frame (latest frame wins), so a slow pipeline never builds a backlog;
+    each event reports how many frames were dropped since the previous one.
+
+    The connection can stay open for a whole class, so it holds no DB
+    session: binding and every frame use their own short-lived one.
+    """
+    with SessionLocal() as db:
+        session = active_sessions.get(db, session_id)
+        if session and session.is_active:
+            session_galleries.get_or_open(db, session)
+    if not session or not session.is_active:
+        await websocket.close(code=4404, reason="session not found or not active")
+        return
+
+    await websocket.accept()
+    await websocket.send_json({"type": "bound", "session_id": str(session.id)})
+    kiosk_key = kiosk_id or (websocket.client.host if websocket.client else "unknown")
+
+    pending = None  # latest unprocessed frame
+    dropped = 0
+    ready = asyncio.Event()
+    closed = False
+
+    async def receive():
+        nonlocal pending, dropped, closed
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if not data:
+                    continue  # text messages (e.g. keep-alive pings) are ignored
+                if pending is not None:
+                    dropped += 1
+                pending = data
+                ready.set()
+        finally:
+            closed = True
+            ready.set()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            if closed:
+                break
+            if pending is None:
+                continue
+            data, pending = pending, None
+            if session_galleries.get(session.id) is None:
+                # end_session dropped the session's gallery
+                await websocket.send_json({"type": "closed", "reason": "session ended"})
+                await websocket.close()
+                break
+
+            try:
+                with SessionLocal() as db:
+                    result = await _recognize_frame(
+                        db, session, face_service.Frame(data), kiosk_id, kiosk_key
+                    )
+            except HTTPException as exc:
+                result = {"status": "error", "detail": exc.detail}
+            await websocket.send_json({"type": "result", **result, "dropped": dropped})
+            dropped = 0
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # client went away mid-send
+    finally:
+        receiver.cancel()
+
+
+def _keep_probe(frame, status, bbox):
+    """Queue the probe if the policy keeps `status`; its URI, or None if it won't be written."""
+    key = probe_writer.plan(frame, status, bbox)
+    if key is None or not probe_writer.submit(frame, key, bbox):
+        return None
+    return store.uri(key)
+
+
+async def _mark_with_probe(db, session, student_id, score, frame, bbox) -> bool:
+    """
+    Record a match. image_path is only set when the probe is kept, and a
+    kept probe is written (never dropped) once the row is committed.
+    Returns False if a concurrent request had already marked the student.
+    """
+    key = probe_writer.plan(frame, "matched", bbox)
+    row = attendance_row(session.id, student_id, score, store.uri(key) if key else None)
+    recorded = record_attendance(db, [row])
+    if student_id not in recorded:
+        return False
+    if key is not None:
+        await probe_writer.submit_required(frame, key, bbox)
+    return True
+
+
+async def _match_and_mark(db, session, embedding, frame, bbox):
+    """
+    Match one probe embedding against the session gallery and record
+    attendance; the frame's probe is kept according to the outcome.
+    """
+    candidates = session_galleries.get_or_open(db, session)
+    best = candidates.search(embedding)
+    if best is None:
+        _keep_probe(frame, "no_embeddings", bbox)
         return {"status": "no_embeddings"}
 
+    # the session gallery only holds students enrolled in the subject
     if best["score"] >= config.MATCH_SIMILARITY_THRESHOLD:
-        enrolled = (
-            db.query(CourseEnrollment)
-            .filter_by(user_id=best["student_id"], subject_id=session.subject_id)
-            .first()
-        )
-        if not enrolled:
-            return {
-                "status": "not_enrolled",
-                "student_id": str(best["student_id"]),
-                "enrollment_no": best.get("enrollment_no"),
-                "score": best["score"],
-            }
-
-        already = (
-            db.query(AttendanceRecord)
-            .filter_by(session_id=session_id, student_id=best["student_id"])
-            .first()
-        )
-        if already:
+        # a concurrent frame of the same student may have won the insert
+        if candidates.is_marked(best["student_id"]) or not await _mark_with_probe(
+            db, session, best["student_id"], best["score"], frame, bbox
+        ):
+            candidates.mark(best["student_id"])
+            _keep_probe(frame, "already_marked", bbox)
             return {
                 "status": "already_marked",
                 "student_id": str(best["student_id"]),
                 "score": best["score"],
             }
-
-        att = AttendanceRecord(
-            session_id=session_id,
-            student_id=best["student_id"],
-            status="PRESENT",
-            confidence=str(best["score"]),
-            image_path=str(probe_path),
-        )
-        db.add(att)
-        db.commit()
+        candidates.mark(best["student_id"])
         return {
             "status": "matched",
             "student_id": str(best["student_id"]),
@@ -118,92 +249,64 @@ async def kiosk_mark_attendance(
         return {
             "status": "unresolved",
             "top_score": best["score"],
-            "probes": str(probe_path),
+            "probes": _keep_probe(frame, "unresolved", bbox),
         }
 
+
 @router.post("/mark-attendance-multicam")
 async def kiosk_mark_attendance_multicam(
     session_id: str = Form(...),
     files: list[UploadFile] = File(...),
+    kiosk_id: Optional[str] = Form(None),
     db: Session = Depends(get_db),
 ):
     """
-    Accepts up to N frames (e.g. 2 per webcam), runs face recognition on each, and
-    marks attendance based on the BEST MATCH among all frames.
+    Accepts up to N frames (e.g. 2 per webcam) of one person, runs face
+    recognition on them and marks attendance on the fused match
+    (MULTICAM_FUSION) across all frames.
     """
 
     # 1) Validate session
-    session = db.query(ClassSession).filter_by(id=session_id).first()
+    session = active_sessions.get(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="session not found")
 
-    # 2) Load all students
-    students = db.query(User).filter(User.role == RoleEnum.STUDENT).all()
-
-    best_global = None  # best match across ALL frames
-
-    for uploaded in files:
-        content = await uploaded.read()
-        if not content:
-            continue
-
-        # convert to base64
-        b64_str = base64.b64encode(content).decode("utf-8")
-
-        # get embedding
-        embedding, bbox = face_service.get_embedding_from_b64(b64_str)
-        if embedding is None:
-            # no face found in this frame
+    candidates = session_galleries.get_or_open(db, session)
+    best_global = None  # fused best match across frames
+    probes, weights, seen = [], [], []  # per frame with a face: embedding, det score, (frame, bbox)
+
+    # 2) detect MULTICAM_WAVE frames at a time concurrently on the inference
+    #    pool, stacking their embeddings
+    wave = max(1, config.MULTICAM_WAVE)
+    for start in range(0, len(files), wave):
+        frames = []
+        for uploaded in files[start:start + wave]:
+            content = await uploaded.read()
+            if content:
+                frames.append(face_service.Frame(content))
+        results = await asyncio.gather(
+            *(inference_pool.run(face_service.get_probe, frame, kiosk_id) for frame in frames)
+        )
+        for frame, (embedding, bbox, det_score) in zip(frames, results):
+            if embedding is not None:
+                probes.append(embedding)
+                weights.append(det_score)
+                seen.append((frame, bbox))
+        if not probes:
             continue
 
-        probe_vec = np.array(embedding, dtype=np.float32)
-
-        best_for_frame = {
-            "student_id": None,
-            "score": -1.0,
-            "name": None,
-            "enrollment_no": None,
-            "b64": b64_str,
-        }
-
-        # 3) loop through all students, using FaceEmbedding table
-        for student in students:
-            embs = db.query(FaceEmbedding).filter_by(user_id=student.id).all()
-            if not embs:
-                continue
-
-            mat = np.array([e.embedding for e in embs], dtype=np.float32)
-            if mat.size == 0:
-                continue
-
-            # centroid of embeddings
-            centroid = mat.mean(axis=0)
+        # 3) score all frames so far against the session gallery at once and fuse
+        fused = candidates.fuse(
+            np.stack(probes), weights, config.MULTICAM_FUSION, config.MULTICAM_TOPK
+        )
+        if fused is None:
+            break
+        slot, score, i = fused
+        best_global = {**candidates.candidate(slot, score), "frame": seen[i][0], "bbox": seen[i][1]}
 
-            # normalize like in single-camera logic
-            denom = np.linalg.norm(centroid)
-            if denom == 0:
-                continue
-            centroid_norm = centroid / denom
-
-            # cosine similarity via dot product (probe assumed already normalized in your pipeline)
-            similarity = float(np.dot(probe_vec, centroid_norm))
-
-            if similarity > best_for_frame["score"]:
-                best_for_frame.update(
-                    {
-                        "student_id": student.id,
-                        # use full_name & enrollment_no like first endpoint
-                        "name": getattr(student, "full_name", None) or getattr(student, "name", None),
-                        "enrollment_no": getattr(student, "enrollment_no", None),
-                        "score": similarity,
-                    }
-                )
-
-        # 4) update global best if this frame is better
-        if best_for_frame["student_id"] and (
-            best_global is None or best_for_frame["score"] > best_global["score"]
-        ):
-            best_global = best_for_frame
+        # confident enough: the remaining frames are never decoded
+        if config.MULTICAM_EARLY_EXIT_SCORE and score >= config.MULTICAM_EARLY_EXIT_SCORE:
+            break
 
     # -------------------------------------------------------------------------
     # DONE PROCESSING ALL FRAMES — NOW DECIDE BASED ON GLOBAL BEST
@@ -216,32 +319,9 @@ async def kiosk_mark_attendance_multicam(
     name = best_global["name"]
     enr = best_global["enrollment_no"]
 
-    student = db.query(User).filter_by(id=student_id).first()
-    if not student:
-        return {"status": "unresolved", "message": "Could not determine student identity"}
-
-    # 5) Check enrollment (mirror single-camera endpoint)
-    enrolled = (
-        db.query(CourseEnrollment)
-        .filter_by(user_id=student_id, subject_id=session.subject_id)
-        .first()
-    )
-    if not enrolled:
-        return {
-            "status": "not_enrolled",
-            "student_id": str(student_id),
-            "name": name,
-            "enrollment_no": enr,
-            "score": score,
-        }
-
-    # 6) Check if already marked (mirror fields from single-camera endpoint)
-    existing = (
-        db.query(AttendanceRecord)
-        .filter_by(session_id=session_id, student_id=student_id)
-        .first()
-    )
-    if existing:
+    # 4) Check if already marked (mirror fields from single-camera endpoint);
+    #    the session gallery only holds enrolled students
+    if candidates.is_marked(student_id):
         return {
             "status": "already_marked",
             "student_id": str(student_id),
@@ -250,8 +330,9 @@ async def kiosk_mark_attendance_multicam(
             "score": score,
         }
 
-    # 7) Similarity threshold
+    # 5) Similarity threshold (unresolved probes are sampled for review)
     if score < config.MATCH_SIMILARITY_THRESHOLD:
+        _keep_probe(best_global["frame"], "unresolved", best_global["bbox"])
         return {
             "status": "unresolved",
             "student_id": str(student_id),
@@ -261,23 +342,21 @@ async def kiosk_mark_attendance_multicam(
         }
 
     # -------------------------------------------------------------------------
-    # 8) MARK ATTENDANCE
+    # 6) MARK ATTENDANCE
     #    (align this with your AttendanceRecord model fields!)
     # -------------------------------------------------------------------------
-    ts = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-    probe_path = config.PROBES_DIR / f"{session_id}_{ts}.jpg"
-    # save the best probe as image file, if you wish to keep parity with single-camera
-    face_service.save_probe_image_from_b64(best_global["b64"], probe_path)
-
-    record = AttendanceRecord(
-        session_id=session_id,
-        student_id=student_id,
-        status="PRESENT",
-        confidence=str(score),
-        image_path=str(probe_path),
-    )
-    db.add(record)
-    db.commit()
+    # the best probe is written in the background, for parity with single-camera
+    marked = await _mark_with_probe(db, session, student_id, score, best_global["frame"], best_global["bbox"])
+    candidates.mark(student_id)
+    if not marked:
+        # a concurrent request marked this student first
+        return {
+            "status": "already_marked",
+            "student_id": str(student_id),
+            "name": name,
+            "enrollment_no": enr,
+            "score": score,
+        }
 
     return {
         "status": "matched",
@@ -286,3 +365,88 @@ async def kiosk_mark_attendance_multicam(
         "enrollment_no": enr,
         "score": score,
     }
+
+
+@router.post("/mark-attendance-classroom")
+async def kiosk_mark_attendance_classroom(
+    session_id: str = Form(...),
+    files: list[UploadFile] = File(...),
+    kiosk_id: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Classroom mode: marks every recognizable face in one frame (or a
+    multicam batch of frames of the same room) in a single pass.
+
+    All faces of all frames are embedded in one recognizer call and scored
+    against the session gallery with one matrix product. Within a frame
+    faces and students are paired one-to-one (highest scores first, no
+    student twice); across frames each student keeps their best score.
+    """
+    session = active_sessions.get(db, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="session not found")
+
+    frames = []
+    for uploaded in files:
+        content = await uploaded.read()
+        if content:
+            frames.append(face_service.Frame(content))
+    if not frames:
+        raise HTTPException(status_code=400, detail="no image data")
+
+    per_frame = await inference_pool.run(face_service.get_all_embeddings_batch, frames, kiosk_id)
+    faces = sum(len(bboxes) for _, bboxes in per_frame)
+    if faces == 0:
+        return {"status": "no_face", "faces": 0}
+
+    candidates = session_galleries.get_or_open(db, session)
+    best = {}  # student slot -> (score, frame index, bbox)
+    unresolved = 0
+    for i, (embeddings, bboxes) in enumerate(per_frame):
+        if len(bboxes) == 0:
+            continue
+        slots, scores = candidates.score_many(embeddings)
+        pairs = assign_one_to_one(scores, config.MATCH_SIMILARITY_THRESHOLD)
+        unresolved += len(bboxes) - len(pairs)
+        for face, col, score in pairs:
+            slot = int(slots[col])
+            if slot not in best or score > best[slot][0]:
+                best[slot] = (score, i, bboxes[face])
+
+    matched, already_marked, records = [], [], []
+    for slot, (score, i, bbox) in best.items():
+        cand = candidates.candidate(slot, score)
+        entry = {
+            "student_id": str(cand["student_id"]),
+            "name": cand["name"],
+            "enrollment_no": cand["enrollment_no"],
+            "score": score,
+        }
+        if candidates.is_marked(cand["student_id"]):
+            already_marked.append(entry)
+            continue
+        # decide on the probe first: image_path only points at files that get written
+        probe_key = probe_writer.plan(frames[i], "matched", bbox)
+        image_path = store.uri(probe_key) if probe_key else None
+        records.append(attendance_row(session.id, cand["student_id"], score, image_path))
+        matched.append((entry, cand["student_id"], frames[i], probe_key, bbox))
+
+    # one INSERT ... ON CONFLICT DO NOTHING for the whole room
+    recorded = record_attendance(db, records)
+    for entry, student_id, frame, probe_key, bbox in matched:
+        candidates.mark(student_id)
+        if student_id not in recorded:
+            already_marked.append(entry)
+            continue
+        if probe_key is not None:
+            await probe_writer.submit_required(frame, probe_key, bbox)
+    matched = [m for m in matched if m[1] in recorded]
+
+    return {
+        "status": "ok",
+        "faces": faces,
+        "matched": [m[0] for m in matched],
+        "already_marked": already_marked,
+        "unresolved": unresolved,
+    }
@@ -1,11 +1,20 @@
 # backend/routers/sessions.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
+import asyncio
 
 from ..deps import get_db
 from ..models import ClassSession, Subject
 from ..schemas import StartSessionByCode
+from ..gallery import session_galleries
+from ..tracker import trackers
+from ..attendance_writer import attendance_buffer
+from ..analytics import refresh_session_rollup
+from ..session_cache import active_sessions as active_cache, sessions_etag, sessions_json
+from .. import config
 from datetime import datetime, timezone
 from sqlalchemy import or_
 
@@ -59,6 +68,10 @@ def start_session_by_code(
     db.commit()
     db.refresh(cs)
 
+    # materialize the enrolled-student candidate gallery for the kiosk
+    session_galleries.open(db, cs)
+    active_cache.invalidate()
+
     return {
         "id": str(cs.id),
         "subject_id": str(subject.id),
@@ -71,44 +84,80 @@ def start_session_by_code(
 
 
 
-@router.post("/{session_id}/end")
-def end_session(session_id: str, db: Session = Depends(get_db)):
+def _deactivate(db, session_id):
     cs = db.query(ClassSession).filter_by(id=session_id).first()
     if not cs:
         raise HTTPException(status_code=404, detail="session not found")
     cs.is_active = False
-    db.add(cs)
     db.commit()
-    return {"ok": True}
+    db.refresh(cs)  # loaded here, not lazily on the event loop
+    return cs
 
 
-@router.get("/active")
-def active_sessions(db: Session = Depends(get_db)):
-    now = datetime.now(timezone.utc)
+def _roll_up(db, cs):
+    refresh_session_rollup(db, cs)
+    db.commit()
+
 
-    rows = (
-        db.query(ClassSession)
-        .filter(
-            ClassSession.is_active == True,
-            or_(
-                ClassSession.end_time == None,
-                ClassSession.end_time > now,
-            ),
+@router.post("/{session_id}/end")
+async def end_session(session_id: str, db: Session = Depends(get_db)):
+    cs = await run_in_threadpool(_deactivate, db, session_id)
+    # kiosks stop marking this session from here on
+    session_galleries.drop(cs.id)
+    trackers.drop_session(cs.id)
+    active_cache.invalidate()
+
+    # roll up the headcount for the dashboards only once every kiosk mark
+    # still in the write-behind buffer (or being written) is committed
+    if not await attendance_buffer.flush():
+        raise HTTPException(
+            status_code=503,
+            detail="session ended, but buffered attendance could not be written yet; retry to refresh its summary",
         )
-        .all()
-    )
+    await run_in_threadpool(_roll_up, db, cs)
+    return {"ok": True}
 
-    return [
-        {
-            "id": str(r.id),
-            "subject_id": str(r.subject_id),
-            "faculty_id": str(r.faculty_id) if r.faculty_id else None,
-            "start_time": r.start_time,
-            "end_time": r.end_time,
-            "is_active": True,  # only true if also not expired
-        }
-        for r in rows
-    ]
+
+@router.get("/active")
+def active_sessions(request: Request, response: Response, db: Session = Depends(get_db)):
+    # served from the in-process cache; unchanged polls get a bodyless 304
+    sessions = active_cache.active(db)
+    etag = sessions_etag(sessions)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return [s.to_dict() for s in sessions]
+
+
+@router.get("/active/stream")
+async def active_sessions_stream(request: Request):
+    """
+    Server-sent events: a `sessions` event with the active-session list on
+    connect and whenever it changes (session started / ended / expired),
+    comment keep-alives in between, so kiosks need not poll.
+    """
+    async def events():
+        last = None
+        with active_cache.subscribe() as changed:
+            while not await request.is_disconnected():
+                sessions = await run_in_threadpool(active_cache.active)
+                etag = sessions_etag(sessions)
+                if etag != last:
+                    last = etag
+                    yield f"event: sessions\ndata: {sessions_json(sessions)}\n\n"
+                else:
+                    yield ": keep-alive\n\n"
+                try:
+                    await asyncio.wait_for(changed.wait(), config.SESSION_STREAM_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    pass
+                changed.clear()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("")
@@ -0,0 +1,59 @@
+# backend/scripts/bench_inference.py
+"""
+Measure kiosk frame throughput with and without cross-request batching by
+firing concurrent frames at the inference pool.
+
+    python -m backend.scripts.bench_inference path/to/frames --concurrency 16
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from .. import face_service
+from ..inference import pool
+
+
+async def _drive(scheduler, frames, concurrency, total):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            await scheduler.embed(frames[i % len(frames)])
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("frames_dir", type=Path, help="directory of .jpg/.png kiosk frames")
+    parser.add_argument("--concurrency", type=int, default=16, help="simultaneous requests")
+    parser.add_argument("--total", type=int, default=200, help="frames per run")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    paths = sorted(p for p in args.frames_dir.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if not paths:
+        parser.error(f"no images in {args.frames_dir}")
+    frames = [p.read_bytes() for p in paths]
+
+    async def run_all():
+        pool.start()
+        # warm every worker so model loading is not measured
+        await asyncio.gather(*(pool.run(face_service.get_embedding, frames[0]) for _ in range(pool.workers)))
+        for size in args.batch_sizes:
+            scheduler = face_service.BatchScheduler(max_size=size, max_wait_ms=args.max_wait_ms)
+            fps = await _drive(scheduler, frames, args.concurrency, args.total)
+            print(f"batch<={size:<3} {fps:8.1f} frames/s  ({fps / pool.workers:.1f} per worker)")
+
+    try:
+        asyncio.run(run_all())
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# backend/scripts/bench_search.py
+"""
+Benchmark gallery search backends on a synthetic gallery: per-query
+latency and recall@1 of the IVF index against exact brute force.
+
+    python -m backend.scripts.bench_search --students 50000 --prototypes 3
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ..config import EMBEDDING_DIM, IVF_NLIST, IVF_NPROBE
+from ..search_index import BruteForceIndex, IVFIndex
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+
+def _noisy(x, noise, rng):
+    # noise is the expected norm of the perturbation relative to the unit vector
+    return _unit(x + noise * rng.normal(size=x.shape) / np.sqrt(x.shape[-1]))
+
+
+def synthetic_gallery(students, prototypes, dim, intrinsic=32, seed=0):
+    """
+    Identities live near a low-dimensional subspace (like real face
+    embeddings, which are far from uniformly spread); each student gets
+    `prototypes` noisy rows around its identity.
+    """
+    rng = np.random.default_rng(seed)
+    basis = rng.normal(size=(intrinsic, dim))
+    identities = _noisy(rng.normal(size=(students, intrinsic)) @ basis, 0.3, rng)
+    matrix = _noisy(identities.repeat(prototypes, axis=0), 0.4, rng)
+    return identities, matrix
+
+
+def timed(index, matrix, probes):
+    hits = []
+    t0 = time.perf_counter()
+    for p in probes:
+        hits.append(index.search(matrix, p)[0])
+    return np.asarray(hits), (time.perf_counter() - t0) / len(probes) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--students", type=int, default=50000)
+    parser.add_argument("--prototypes", type=int, default=1, help="rows per student")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nlist", type=int, default=IVF_NLIST, help="0 = sqrt(rows)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, IVF_NPROBE, 16, 32])
+    args = parser.parse_args()
+
+    identities, matrix = synthetic_gallery(args.students, args.prototypes, EMBEDDING_DIM)
+    rng = np.random.default_rng(1)
+    who = rng.integers(0, args.students, size=args.queries)
+    probes = _noisy(identities[who], 0.6, rng)
+
+    print(f"gallery: {args.students} students x {args.prototypes} rows = {len(matrix)} rows, dim {EMBEDDING_DIM}")
+
+    exact, brute_ms = timed(BruteForceIndex(), matrix, probes)
+    exact_students = exact // args.prototypes
+    print(f"{'backend':<22}{'ms/query':>10}{'recall@1':>10}{'identity acc':>14}")
+    print(f"{'brute':<22}{brute_ms:>10.3f}{1.0:>10.3f}{np.mean(exact_students == who):>14.3f}")
+
+    ivf = IVFIndex(nlist=args.nlist, min_rows=0)
+    t0 = time.perf_counter()
+    ivf.fit(matrix)
+    print(f"ivf train: {len(ivf.centroids)} lists in {time.perf_counter() - t0:.2f}s")
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        hits, ms = timed(ivf, matrix, probes)
+        students = hits // args.prototypes
+        recall = np.mean(students == exact_students)
+        label = f"ivf nprobe={nprobe}"
+        print(f"{label:<22}{ms:>10.3f}{recall:>10.3f}{np.mean(students == who):>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# backend/scripts/bulk_enroll.py
+"""
+Enroll faces for many students from a ZIP archive or directory laid out
+as enrollment_no/*.jpg, using a dedicated process pool.
+
+    python -m backend.scripts.bulk_enroll students.zip --workers 8
+
+Interrupted runs resume from the journal (default: <archive>.journal.jsonl).
+A running API server picks the new templates up on its next start.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from ..bulk_enroll import ArchiveSource, Journal, enroll_archive, summarize
+from ..db import SessionLocal
+from ..inference import InferencePool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", type=Path, help="ZIP archive or directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--executor", choices=("process", "thread"), default="process")
+    parser.add_argument("--chunk-size", type=int, default=None, help="images per inference job")
+    parser.add_argument("--journal", type=Path, default=None)
+    args = parser.parse_args()
+
+    journal = Journal(args.journal or args.source.with_name(args.source.name + ".journal.jsonl"))
+    if journal.done:
+        print(f"resuming: {len(journal.done)} students already done")
+
+    def progress(report):
+        print(json.dumps(report))
+
+    pool = InferencePool(kind=args.executor, workers=args.workers, max_pending=args.workers * 2)
+    source = ArchiveSource(args.source)
+    try:
+        t0 = time.perf_counter()
+        pool.start()
+        reports = asyncio.run(
+            enroll_archive(SessionLocal, source, pool, journal, chunk_size=args.chunk_size, progress=progress)
+        )
+        print(json.dumps(summarize(reports)))
+        print(f"done in {time.perf_counter() - t0:.1f}s")
+    finally:
+        source.close()
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
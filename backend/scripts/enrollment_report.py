@@ -0,0 +1,110 @@
+# backend/scripts/enrollment_report.py
+"""
+Report enrollment sample counts and compare recognition accuracy of
+galleries built from all samples vs. the MAX_SAMPLES_PER_STUDENT most
+diverse ones (held-out samples of each student used as probes).
+
+    python -m backend.scripts.enrollment_report --cap 10 --holdout 0.2
+"""
+import argparse
+
+import numpy as np
+
+from ..config import MATCH_SIMILARITY_THRESHOLD, MAX_SAMPLES_PER_STUDENT, MIN_SAMPLES_PER_STUDENT
+from ..db import SessionLocal
+from ..embeddings import decode_many
+from ..face_templates import select_diverse
+from ..models import FaceEmbedding, User
+
+
+def load_samples(db, batch_size=5000):
+    """enrollment_no -> (n, dim) matrix, streamed in user order."""
+    q = (
+        db.query(User.enrollment_no, FaceEmbedding.embedding)
+        .join(FaceEmbedding, FaceEmbedding.user_id == User.id)
+        .order_by(User.id)
+        .yield_per(batch_size)
+    )
+    samples, current, blobs = {}, None, []
+    for enrollment_no, blob in q:
+        if enrollment_no != current and blobs:
+            samples[current] = decode_many(blobs)
+            blobs = []
+        current = enrollment_no
+        blobs.append(blob)
+    if blobs:
+        samples[current] = decode_many(blobs)
+    return samples
+
+
+def _centroids(parts):
+    mat = np.stack([p.mean(axis=0) for p in parts])
+    return mat / np.linalg.norm(mat, axis=1, keepdims=True)
+
+
+def evaluate(gallery, probes, owners):
+    scores = probes @ gallery.T
+    best = scores.argmax(axis=1)
+    top = scores[np.arange(len(probes)), best]
+    correct = best == owners
+    return {
+        "rank1": float(correct.mean()),
+        "accepted_correct": float((correct & (top >= MATCH_SIMILARITY_THRESHOLD)).mean()),
+        "genuine_mean": float(scores[np.arange(len(probes)), owners].mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cap", type=int, default=MAX_SAMPLES_PER_STUDENT or 20)
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of each student's samples used as probes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        samples = load_samples(db)
+    finally:
+        db.close()
+    if not samples:
+        print("no enrolled samples")
+        return
+
+    counts = np.array([len(m) for m in samples.values()])
+    below = sorted(e for e, m in samples.items() if len(m) < MIN_SAMPLES_PER_STUDENT)
+    print(f"students with samples: {len(samples)}, samples: {counts.sum()}")
+    print(f"samples per student: min {counts.min()}, median {int(np.median(counts))}, max {counts.max()}")
+    print(f"below MIN_SAMPLES_PER_STUDENT ({MIN_SAMPLES_PER_STUDENT}): {len(below)}")
+    for e in below[:20]:
+        print(f"  {e}: {len(samples[e])}")
+
+    rng = np.random.default_rng(args.seed)
+    full, pruned, probes, owners = [], [], [], []
+    for mat in samples.values():
+        if len(mat) < 2:
+            # too few to hold any out, still a distractor in the gallery
+            full.append(mat)
+            pruned.append(mat)
+            continue
+        order = rng.permutation(len(mat))
+        n_probe = max(1, int(len(mat) * args.holdout))
+        rest = mat[order[n_probe:]]
+        full.append(rest)
+        pruned.append(rest[select_diverse(rest, args.cap)])
+        probes.append(mat[order[:n_probe]])
+        owners.extend([len(full) - 1] * n_probe)
+    if not probes:
+        print("not enough samples to evaluate")
+        return
+
+    probes, owners = np.concatenate(probes), np.asarray(owners)
+    print(f"\nevaluated on {len(probes)} held-out probes against {len(full)} students, cap {args.cap}")
+    print(f"{'gallery':<10}{'samples':>10}{'rank-1':>10}{'accepted':>10}{'genuine':>10}")
+    for label, parts in (("all", full), ("pruned", pruned)):
+        res = evaluate(_centroids(parts), probes, owners)
+        print(f"{label:<10}{sum(len(p) for p in parts):>10}{res['rank1']:>10.3f}"
+              f"{res['accepted_correct']:>10.3f}{res['genuine_mean']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# backend/scripts/explain_queries.py
+"""
+Run EXPLAIN ANALYZE on the hot kiosk / session / admin queries and flag
+sequential scans.
+
+By default a synthetic dataset (students, subjects, enrollments, sessions,
+attendance, face embeddings) is seeded inside a transaction that is rolled
+back at the end, so the database is left untouched; --no-seed explains
+against the data already there.
+
+    python -m backend.scripts.explain_queries --students 20000 --sessions 1000
+    python -m backend.scripts.explain_queries --no-seed --verbose
+"""
+import argparse
+from datetime import datetime, timezone
+
+from sqlalchemy import or_, select, text
+from sqlalchemy.orm import Session
+
+from ..db import engine, init_db
+from ..models import AttendanceRecord, ClassSession, CourseEnrollment, FaceEmbedding, User
+from .. import user_queries
+
+SEED_TABLES = ("users", "subjects", "course_enrollments", "class_sessions",
+               "attendance_records", "face_embeddings")
+
+
+# ---------- Seeding ----------
+
+def seed(conn, students, subjects, sessions, per_student=5, embeddings=3):
+    """Bulk-insert a synthetic dataset with generate_series (ids via gen_random_uuid)."""
+    role_type = User.__table__.c.role.type.name
+    params = {"students": students, "subjects": subjects, "sessions": sessions,
+              "per_student": per_student, "embeddings": embeddings}
+    statements = [
+        "CREATE TEMP TABLE seed_users ON COMMIT DROP AS "
+        "SELECT g AS n, gen_random_uuid() AS id FROM generate_series(0, :students - 1) g",
+        "CREATE TEMP TABLE seed_subjects ON COMMIT DROP AS "
+        "SELECT g AS n, gen_random_uuid() AS id FROM generate_series(0, :subjects - 1) g",
+        "CREATE TEMP TABLE seed_sessions ON COMMIT DROP AS "
+        "SELECT g AS n, gen_random_uuid() AS id FROM generate_series(0, :sessions - 1) g",
+        f"INSERT INTO users (id, email, enrollment_no, password_hash, full_name, role, semester) "
+        f"SELECT id, 'seed' || n || '@seed.invalid', 'SEED' || n, 'x', 'Seed ' || n, "
+        f"'STUDENT'::{role_type}, n % 8 + 1 FROM seed_users",
+        "INSERT INTO subjects (id, name, code) "
+        "SELECT id, 'Seed subject ' || n, 'SEED' || n FROM seed_subjects",
+        "INSERT INTO course_enrollments (id, user_id, subject_id) "
+        "SELECT gen_random_uuid(), u.id, s.id FROM seed_users u "
+        "JOIN generate_series(0, :per_student - 1) k ON true "
+        "JOIN seed_subjects s ON s.n = (u.n + k * 7) % :subjects",
+        # the last few sessions are running now, the rest ended hours ago
+        "INSERT INTO class_sessions (id, subject_id, faculty_id, start_time, end_time, is_active) "
+        "SELECT ss.id, s.id, f.id, now() - (:sessions - ss.n) * interval '1 hour', "
+        "now() - (:sessions - ss.n - 1) * interval '1 hour' + interval '2 hours', "
+        "ss.n >= :sessions - 3 "
+        "FROM seed_sessions ss JOIN seed_subjects s ON s.n = ss.n % :subjects "
+        "JOIN seed_users f ON f.n = ss.n % :students",
+        "INSERT INTO attendance_records (id, session_id, student_id, status, confidence) "
+        "SELECT gen_random_uuid(), cs.id, ce.user_id, 'PRESENT', '0.9' "
+        "FROM class_sessions cs JOIN seed_sessions ss ON ss.id = cs.id "
+        "JOIN course_enrollments ce ON ce.subject_id = cs.subject_id",
+        "INSERT INTO face_embeddings (id, user_id, embedding, image_path) "
+        "SELECT gen_random_uuid(), u.id, '\\x00'::bytea, 'seed/' || u.n || '/' || k "
+        "FROM seed_users u JOIN generate_series(1, :embeddings) k ON true",
+    ]
+    for sql in statements:
+        conn.execute(text(sql), params)
+    for table in SEED_TABLES:
+        conn.execute(text(f"ANALYZE {table}"))
+
+
+def sample_ids(conn):
+    """One active session (with its subject / faculty) and a student enrolled in it."""
+    session_id, subject_id, faculty_id = conn.execute(
+        text("SELECT id, subject_id, faculty_id FROM class_sessions "
+             "ORDER BY is_active DESC, end_time DESC LIMIT 1")
+    ).one()
+    student_id = conn.execute(
+        text("SELECT user_id FROM course_enrollments WHERE subject_id = :s LIMIT 1"),
+        {"s": subject_id},
+    ).scalar()
+    return {
+        "session_id": str(session_id),
+        "subject_id": str(subject_id),
+        "faculty_id": str(faculty_id) if faculty_id else None,
+        "student_id": str(student_id) if student_id else None,
+    }
+
+
+# ---------- Queries ----------
+
+def hot_queries(conn, ids):
+    """(name, statement) for the lookups on the kiosk / polling / admin paths."""
+    now = datetime.now(timezone.utc)
+    active = (ClassSession.is_active == True, or_(ClassSession.end_time == None, ClassSession.end_time > now))  # noqa: E712
+    return [
+        ("active sessions (/api/sessions/active)",
+         select(ClassSession).where(*active)),
+        ("faculty's active session (/api/sessions/start)",
+         select(ClassSession).where(ClassSession.faculty_id == ids["faculty_id"], *active).limit(1)),
+        ("attendance of a student in a session (kiosk mark)",
+         select(AttendanceRecord.id).where(
+             AttendanceRecord.session_id == ids["session_id"],
+             AttendanceRecord.student_id == ids["student_id"],
+         )),
+        ("attendance of a session (/api/attendance?session_id=)",
+         select(AttendanceRecord).where(AttendanceRecord.session_id == ids["session_id"])),
+        ("students of a subject (session gallery)",
+         select(CourseEnrollment.user_id).where(CourseEnrollment.subject_id == ids["subject_id"])),
+        ("face embeddings of a student (train-face / bulk enroll)",
+         select(FaceEmbedding.image_path).where(FaceEmbedding.user_id == ids["student_id"])),
+        ("page of users with subject ids (/api/admin/users)",
+         user_queries.users_page(Session(bind=conn), limit=100).statement),
+    ]
+
+
+def explain(conn, stmt):
+    compiled = stmt.compile(dialect=conn.dialect)
+    rows = conn.exec_driver_sql(
+        "EXPLAIN (ANALYZE, BUFFERS) " + str(compiled), compiled.params
+    ).all()
+    return [r[0] for r in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--subjects", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--no-seed", action="store_true", help="explain against the existing data")
+    parser.add_argument("--verbose", action="store_true", help="print every plan in full")
+    args = parser.parse_args()
+
+    init_db()
+    seq_scans = 0
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            if not args.no_seed:
+                seed(conn, args.students, args.subjects, args.sessions)
+            ids = sample_ids(conn)
+            for name, stmt in hot_queries(conn, ids):
+                plan = explain(conn, stmt)
+                scans = [line.strip() for line in plan if "Seq Scan" in line]
+                seq_scans += bool(scans)
+                print(f"{'SEQ SCAN' if scans else 'ok':8s}  {name}  [{plan[-1].strip()}]")
+                for line in plan if args.verbose else scans:
+                    print(f"          {line}")
+        finally:
+            # never keep the seeded rows
+            trans.rollback()
+    print(f"{seq_scans} queries with sequential scans")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# backend/scripts/prune_storage.py
+"""
+Delete stored raw images, crops and probes older than their retention
+period (STORAGE_RETENTION_DAYS, 0 = keep forever), in batches.
+
+    python -m backend.scripts.prune_storage --dry-run
+    python -m backend.scripts.prune_storage --kind probes --days 90
+"""
+import argparse
+
+from ..config import STORAGE_RETENTION_DAYS
+from ..file_store import KINDS, store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kind", choices=KINDS, action="append", help="default: every kind")
+    parser.add_argument("--days", type=float, help="override the configured retention")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be deleted")
+    args = parser.parse_args()
+
+    for kind in args.kind or KINDS:
+        days = args.days if args.days is not None else STORAGE_RETENTION_DAYS.get(kind, 0)
+        if not days:
+            print(f"{kind}: kept forever, skipping")
+            continue
+        removed = store.prune(kind, days, batch_size=args.batch_size, dry_run=args.dry_run, pause=args.pause)
+        verb = "would delete" if args.dry_run else "deleted"
+        print(f"{kind}: {verb} {removed} objects older than {days:g} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# backend/scripts/rebuild_templates.py
+"""
+Recompute every FaceTemplate (centroid, running sum, sample count and
+optional medoid prototypes) from the stored face embeddings.
+
+    python -m backend.scripts.rebuild_templates
+"""
+import argparse
+import time
+
+from ..db import SessionLocal
+from ..face_templates import rebuild_templates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows fetched per round-trip")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        n = rebuild_templates(db, batch_size=args.batch_size)
+        print(f"rebuilt {n} templates in {time.perf_counter() - t0:.2f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# backend/scripts/refresh_rollups.py
+"""
+Recompute the attendance rollups (session headcounts and per-student
+subject totals) from the raw records, e.g. for sessions that expired by
+end_time without being ended through the API.
+
+    python -m backend.scripts.refresh_rollups
+"""
+import argparse
+import time
+
+from ..analytics import rebuild_rollups
+from ..db import SessionLocal
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        t0 = time.perf_counter()
+        n = rebuild_rollups(db)
+        print(f"rolled up {n} sessions in {time.perf_counter() - t0:.2f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
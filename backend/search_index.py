@@ -0,0 +1,203 @@
+# backend/search_index.py
+"""
+Nearest-neighbour search backends for the face gallery.
+
+Both backends index the rows of a float32 matrix owned by the caller
+(`GalleryIndex`) and return the best row for an L2-normalized probe:
+
+- `BruteForceIndex`: exact, one matrix-vector product.
+- `IVFIndex`: inverted-file index (spherical k-means coarse quantizer);
+  only the `nprobe` closest lists are scored, trading recall for latency.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from . import config
+
+
+def atomic_write(path: Path, write, mode="wb"):
+    """
+    Call `write(f)` on a uniquely named temp file next to `path`, then
+    os.replace it: a reader (or a live memory map of the previous
+    snapshot) never sees a truncated file, and concurrent writers (several
+    API worker processes) never share a temp file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def save_npy(path: Path, arr):
+    atomic_write(path, lambda f: np.save(f, arr))
+
+
+def _best(scores, rows=None):
+    if len(scores) == 0:
+        return None
+    i = int(np.argmax(scores))
+    return (int(rows[i]) if rows is not None else i), float(scores[i])
+
+
+def _brute_search(matrix, probe, allowed=None):
+    if allowed is None:
+        return _best(matrix @ probe)
+    rows = np.flatnonzero(allowed[: len(matrix)])
+    return _best(matrix[rows] @ probe, rows)
+
+
+class BruteForceIndex:
+    kind = "brute"
+
+    def fit(self, matrix):
+        pass
+
+    def update(self, rows, matrix):
+        pass
+
+    def search(self, matrix, probe, allowed=None):
+        """
+        Return (row, score) of the best match, or None. `allowed` is an
+        optional boolean mask over rows restricting the candidates.
+        """
+        return _brute_search(matrix, probe, allowed)
+
+    def save(self, directory: Path):
+        pass
+
+    def load(self, directory: Path, mmap_mode=None, rows=None) -> bool:
+        return True
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, nlist=None, nprobe=None, min_rows=None, train_iters=10, seed=0):
+        self.nlist = config.IVF_NLIST if nlist is None else nlist
+        self.nprobe = config.IVF_NPROBE if nprobe is None else nprobe
+        self.min_rows = config.IVF_MIN_ROWS if min_rows is None else min_rows
+        self.train_iters = train_iters
+        self.seed = seed
+        self.centroids = None  # (nlist, dim) coarse quantizer
+        self.assign = np.zeros(0, dtype=np.int32)  # row -> list
+        self._order = None  # rows sorted by list
+        self._offsets = None  # list l spans _order[_offsets[l]:_offsets[l + 1]]
+
+    # ---------- Training ----------
+
+    def fit(self, matrix):
+        n = len(matrix)
+        if n < self.min_rows:
+            self.centroids = None
+            self.assign = np.zeros(0, dtype=np.int32)
+            return
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+        sample = matrix[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            labels = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = centroids[empty]  # keep previous centroid for empty lists
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+
+        self.centroids = centroids.astype(np.float32)
+        self.assign = self._nearest(matrix, self.centroids)
+        self._order = None
+
+    @staticmethod
+    def _nearest(matrix, centroids, chunk=8192):
+        out = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), chunk):
+            out[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+        return out
+
+    def update(self, rows, matrix):
+        """Re-assign changed or appended rows without retraining the quantizer."""
+        if self.centroids is None:
+            if len(matrix) >= self.min_rows:
+                self.fit(matrix)
+            return
+        if len(self.assign) < len(matrix):
+            grown = np.zeros(len(matrix), dtype=np.int32)
+            grown[: len(self.assign)] = self.assign
+            self.assign = grown
+        rows = np.asarray(rows, dtype=np.int64)
+        self.assign[rows] = self._nearest(matrix[rows], self.centroids)
+        self._order = None
+
+    # ---------- Search ----------
+
+    def _lists(self):
+        if self._order is None:
+            self._order = np.argsort(self.assign, kind="stable")
+            self._offsets = np.searchsorted(
+                self.assign[self._order], np.arange(len(self.centroids) + 1)
+            )
+        return self._order, self._offsets
+
+    def search(self, matrix, probe, allowed=None):
+        if self.centroids is None or len(self.assign) < len(matrix):
+            return _brute_search(matrix, probe, allowed)
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        coarse = self.centroids @ probe
+        lists = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+        order, offsets = self._lists()
+        rows = np.concatenate([order[offsets[l]:offsets[l + 1]] for l in lists])
+        if allowed is not None:
+            rows = rows[allowed[rows]]
+            if len(rows) == 0:
+                # none of the allowed rows fell in the probed lists
+                return _brute_search(matrix, probe, allowed)
+        return _best(matrix[rows] @ probe, rows)
+
+    # ---------- Persistence ----------
+
+    def save(self, directory: Path):
+        c_path, a_path = directory / "ivf_centroids.npy", directory / "ivf_assign.npy"
+        if self.centroids is None:
+            # no trained quantizer: lists from an older snapshot must not be reloaded
+            c_path.unlink(missing_ok=True)
+            a_path.unlink(missing_ok=True)
+            return
+        save_npy(c_path, self.centroids)
+        save_npy(a_path, self.assign)
+
+    def load(self, directory: Path, mmap_mode=None, rows=None) -> bool:
+        """Load saved lists; False (caller re-fits) if missing or not for `rows` rows."""
+        c_path, a_path = directory / "ivf_centroids.npy", directory / "ivf_assign.npy"
+        if not (c_path.exists() and a_path.exists()):
+            if rows is not None and rows < self.min_rows:
+                # too small to train: nothing was saved, nothing is missing
+                self.centroids, self.assign = None, np.zeros(0, dtype=np.int32)
+                return True
+            return False
+        centroids = np.load(c_path, mmap_mode=mmap_mode)
+        assign = np.load(a_path, mmap_mode=mmap_mode)
+        if rows is not None and len(assign) != rows:
+            return False
+        self.centroids, self.assign = centroids, assign
+        self._order = None
+        return True
+
+
+def make_index(kind=None):
+    kind = kind or config.SEARCH_BACKEND
+    if kind == "brute":
+        return BruteForceIndex()
+    if kind == "ivf":
+        return IVFIndex()
+    raise ValueError(f"unknown SEARCH_BACKEND '{kind}'")
@@ -0,0 +1,153 @@
+# backend/session_cache.py
+"""
+In-process view of the active class sessions.
+
+Every kiosk polls /api/sessions/active and every kiosk frame looks its
+session up by id; both are served from here instead of Postgres. The
+active rows are reloaded at most every ACTIVE_SESSIONS_TTL_S, and right
+away after start_session_by_code / end_session invalidate the cache (the
+TTL only matters for changes made by another API process). Sessions past
+their end_time drop out at read time without a reload.
+
+Readers get immutable `SessionInfo` snapshots, safe to share between
+threads and requests. `subscribe()` hands out asyncio events that are set
+on every invalidation, for the server-sent-events feed.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from fastapi.encoders import jsonable_encoder
+
+from . import config
+from .db import SessionLocal
+from .models import ClassSession
+
+
+class SessionInfo:
+    __slots__ = ("id", "subject_id", "faculty_id", "start_time", "end_time", "is_active")
+
+    def __init__(self, row: ClassSession):
+        self.id = row.id
+        self.subject_id = row.subject_id
+        self.faculty_id = row.faculty_id
+        self.start_time = row.start_time
+        self.end_time = row.end_time
+        self.is_active = bool(row.is_active)
+
+    def is_live(self, now) -> bool:
+        return self.is_active and (self.end_time is None or self.end_time > now)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": str(self.id),
+            "subject_id": str(self.subject_id),
+            "faculty_id": str(self.faculty_id) if self.faculty_id else None,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "is_active": True,  # only listed if also not expired
+        }
+
+
+def sessions_json(sessions) -> str:
+    return json.dumps(jsonable_encoder([s.to_dict() for s in sessions]), separators=(",", ":"))
+
+
+def sessions_etag(sessions) -> str:
+    return '"' + hashlib.sha1(sessions_json(sessions).encode()).hexdigest() + '"'
+
+
+class ActiveSessionCache:
+    def __init__(self, ttl=None):
+        self.ttl = config.ACTIVE_SESSIONS_TTL_S if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._loaded_at = None
+        self._generation = 0  # bumped by invalidate()
+        self._subscribers = set()  # (loop, asyncio.Event)
+        self.loads = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _refresh(self, db):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                self.hits += 1
+                return self._by_id
+            generation = self._generation
+        own = db is None
+        db = db or SessionLocal()
+        try:
+            rows = db.query(ClassSession).filter(ClassSession.is_active == True).all()  # noqa: E712
+            by_id = {str(r.id): SessionInfo(r) for r in rows}
+        finally:
+            if own:
+                db.close()
+        with self._lock:
+            # a load that raced with invalidate() may predate the change: use
+            # it for this caller but don't cache it
+            if generation == self._generation:
+                self._by_id, self._loaded_at = by_id, time.monotonic()
+            self.loads += 1
+        return by_id
+
+    def active(self, db=None) -> list:
+        """Sessions active right now, oldest first."""
+        now = datetime.now(timezone.utc)
+        live = [s for s in self._refresh(db).values() if s.is_live(now)]
+        return sorted(live, key=lambda s: (s.start_time, str(s.id)))
+
+    def get(self, db, session_id):
+        """
+        SessionInfo for `session_id`, from the cache when it is active;
+        inactive (ended) sessions fall back to one query. None if unknown.
+        """
+        try:
+            key = str(uuid.UUID(str(session_id)))
+        except ValueError:
+            return None
+        info = self._refresh(db).get(key)
+        if info is not None:
+            return info
+        self.misses += 1
+        row = db.query(ClassSession).filter_by(id=key).first()
+        return SessionInfo(row) if row is not None else None
+
+    def invalidate(self):
+        """Drop the cached rows and wake every subscriber (thread-safe)."""
+        with self._lock:
+            self._loaded_at = None
+            self._generation += 1
+            subscribers = list(self._subscribers)
+        for loop, event in subscribers:
+            loop.call_soon_threadsafe(event.set)
+
+    @contextmanager
+    def subscribe(self):
+        """asyncio.Event set whenever the cache is invalidated; use from the event loop."""
+        entry = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._subscribers.add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                self._subscribers.discard(entry)
+
+    def stats(self):
+        return {
+            "ttl_s": self.ttl,
+            "cached": len(self._by_id),
+            "loads": self.loads,
+            "hits": self.hits,
+            "misses": self.misses,
+            "subscribers": len(self._subscribers),
+        }
+
+
+active_sessions = ActiveSessionCache()
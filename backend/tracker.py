@@ -0,0 +1,189 @@
+# backend/tracker.py
+"""
+Per-kiosk face tracks for continuous kiosk streams.
+
+Kiosks POST frames back to back, so the same student standing in front
+of the camera is recognized over and over. Each (session, kiosk) gets a
+`KioskTracker` whose tracks link faces across consecutive frames by box
+overlap (IoU) or, after recognition, by embedding similarity. While a
+track is resolved -- its student is in the recently-marked cache, the
+track was seen within TRACK_MAX_GAP_S and last verified by recognition
+within TRACK_REVERIFY_S -- frames whose face overlaps it skip the
+recognizer and the gallery entirely. Re-verification bounds how long a
+different person stepping into the same spot could be mistaken for the
+previous one.
+
+A `KioskTracker`'s tracks are only touched by the kiosk handlers, which
+are async and run on the event loop. The registry and the
+recently-marked cache are shared with other endpoints (end_session drops
+a session's entries; the stats endpoint runs in the threadpool), so
+their dicts are guarded by a lock.
+"""
+import threading
+import time
+
+import numpy as np
+
+from . import config
+
+RESOLVED_STATUSES = ("matched", "already_marked")
+
+
+def iou(a, b) -> float:
+    ax1, ay1, ax2, ay2 = a
+    bx1, by1, bx2, by2 = b
+    iw = max(0, min(ax2, bx2) - max(ax1, bx1))
+    ih = max(0, min(ay2, by2) - max(ay1, by1))
+    inter = iw * ih
+    union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def overlaps_any(bbox, boxes, threshold=None) -> bool:
+    threshold = config.TRACK_IOU if threshold is None else threshold
+    return any(iou(bbox, b) >= threshold for b in boxes or ())
+
+
+class RecentlyMarked:
+    """Short-lived cache of (session, student) -> response of the last match."""
+
+    def __init__(self, ttl=None):
+        self.ttl = config.RECENT_MARK_TTL_S if ttl is None else ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def add(self, session_id, student_id, entry, now=None):
+        now = now or time.monotonic()
+        with self._lock:
+            self._entries[(str(session_id), str(student_id))] = (entry, now + self.ttl)
+            if len(self._entries) > 4096:
+                self._entries = {k: v for k, v in self._entries.items() if v[1] > now}
+
+    def get(self, session_id, student_id, now=None):
+        with self._lock:
+            hit = self._entries.get((str(session_id), str(student_id)))
+        if hit is None or hit[1] <= (now or time.monotonic()):
+            return None
+        return hit[0]
+
+    def drop_session(self, session_id):
+        sid = str(session_id)
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if k[0] != sid}
+
+
+class Track:
+    __slots__ = ("bbox", "embedding", "student_id", "last_seen", "verified_at")
+
+    def __init__(self, bbox, embedding, student_id, now):
+        self.bbox = bbox
+        self.embedding = embedding
+        self.student_id = student_id
+        self.last_seen = now
+        self.verified_at = now
+
+
+class KioskTracker:
+    def __init__(self, session_id, recent):
+        self.session_id = str(session_id)
+        self.recent = recent
+        self.tracks = []
+        self.last_used = time.monotonic()
+
+    def _prune(self, now):
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= config.TRACK_MAX_GAP_S]
+
+    def _resolved(self, now):
+        for t in self.tracks:
+            if (
+                t.student_id is not None
+                and now - t.verified_at <= config.TRACK_REVERIFY_S
+                and self.recent.get(self.session_id, t.student_id, now) is not None
+            ):
+                yield t
+
+    def resolved_boxes(self):
+        """Boxes of resolved tracks, sent along with the frame to skip recognition."""
+        now = time.monotonic()
+        self.last_used = now
+        self._prune(now)
+        return [t.bbox for t in self._resolved(now)]
+
+    def follow(self, bbox):
+        """
+        Cached response for a face the worker matched to a resolved track by
+        IoU, updating the track; None if the track has expired meanwhile.
+        """
+        now = time.monotonic()
+        best, best_iou = None, config.TRACK_IOU
+        for t in self._resolved(now):
+            overlap = iou(bbox, t.bbox)
+            if overlap >= best_iou:
+                best, best_iou = t, overlap
+        if best is None:
+            return None
+        best.bbox, best.last_seen = bbox, now
+        entry = self.recent.get(self.session_id, best.student_id, now)
+        return {"status": "already_marked", **entry, "tracked": True}
+
+    def observe(self, bbox, embedding, result):
+        """Record a recognized face: extend the track it belongs to or start one."""
+        now = time.monotonic()
+        emb = np.asarray(embedding, dtype=np.float32)
+        student_id = result.get("student_id") if result.get("status") in RESOLVED_STATUSES else None
+
+        track = None
+        for t in self.tracks:
+            if iou(bbox, t.bbox) >= config.TRACK_IOU or float(t.embedding @ emb) >= config.TRACK_EMBED_SIM:
+                track = t
+                break
+        if track is None:
+            self.tracks.append(Track(bbox, emb, student_id, now))
+        else:
+            track.bbox, track.embedding, track.student_id = bbox, emb, student_id
+            track.last_seen = track.verified_at = now
+
+        if student_id is not None:
+            self.recent.add(self.session_id, student_id, {
+                k: result[k] for k in ("student_id", "name", "enrollment_no", "score") if k in result
+            }, now)
+
+
+class TrackerRegistry:
+    def __init__(self):
+        self.recent = RecentlyMarked()
+        self._trackers = {}
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.skipped = 0
+
+    def get(self, session_id, kiosk_key) -> KioskTracker:
+        key = (str(session_id), kiosk_key)
+        with self._lock:
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                self._prune_idle()
+                tracker = self._trackers[key] = KioskTracker(session_id, self.recent)
+        return tracker
+
+    def drop_session(self, session_id):
+        sid = str(session_id)
+        with self._lock:
+            self._trackers = {k: v for k, v in self._trackers.items() if k[0] != sid}
+        self.recent.drop_session(sid)
+
+    def _prune_idle(self, idle=60.0):
+        # caller holds self._lock
+        now = time.monotonic()
+        self._trackers = {k: v for k, v in self._trackers.items() if now - v.last_used <= idle}
+
+    def stats(self):
+        return {
+            "enabled": config.TRACKING_ENABLED,
+            "trackers": len(self._trackers),
+            "frames": self.frames,
+            "recognition_skipped": self.skipped,
+        }
+
+
+trackers = TrackerRegistry()
@@ -0,0 +1,75 @@
+# backend/user_queries.py
+"""
+User listing / lookup queries shared by the admin and auth routers.
+
+Enrolled subject ids and face image counts are correlated subqueries in
+the same SELECT as the user rows (`array_agg` over course_enrollments,
+`count` over face_embeddings), so a page of users -- or a single login --
+is one query however many users it holds.
+"""
+from sqlalchemy import String, cast, func, select
+
+from .models import CourseEnrollment, FaceEmbedding, User
+
+
+def subject_ids_column():
+    return (
+        select(func.array_agg(cast(CourseEnrollment.subject_id, String)))
+        .where(CourseEnrollment.user_id == User.id)
+        .correlate(User)
+        .scalar_subquery()
+        .label("subject_ids")
+    )
+
+
+def face_count_column():
+    return (
+        select(func.count(FaceEmbedding.id))
+        .where(FaceEmbedding.user_id == User.id)
+        .correlate(User)
+        .scalar_subquery()
+        .label("face_image_count")
+    )
+
+
+def user_payload(user: User, subject_ids) -> dict:
+    """Same fields as schemas.UserOut, built without a pydantic round trip."""
+    return {
+        "id": str(user.id),
+        "email": user.email,
+        "full_name": user.full_name,
+        "role": user.role,
+        "enrollment_no": user.enrollment_no,
+        "semester": user.semester,
+        "created_at": user.created_at,
+        "subject_ids": list(subject_ids or []),
+    }
+
+
+def find_user(db, *criteria):
+    """(user, subject_ids) for the first user matching `criteria`, or (None, [])."""
+    row = db.query(User, subject_ids_column()).filter(*criteria).first()
+    if row is None:
+        return None, []
+    return row[0], row[1] or []
+
+
+def users_page(db, role=None, semester=None, subject_id=None, after=None, limit=100):
+    """
+    Query for one page of users ordered by id, with subject ids and face
+    image counts: rows of (user, subject_ids, face_image_count).
+    """
+    q = db.query(User, subject_ids_column(), face_count_column())
+    if role is not None:
+        q = q.filter(User.role == role)
+    if semester is not None:
+        q = q.filter(User.semester == semester)
+    if subject_id is not None:
+        q = q.filter(
+            select(CourseEnrollment.id)
+            .where(CourseEnrollment.user_id == User.id, CourseEnrollment.subject_id == subject_id)
+            .exists()
+        )
+    if after is not None:
+        q = q.filter(User.id > after)
+    return q.order_by(User.id).limit(limit)
@@ -134,6 +134,18 @@ export const AppProvider: React.FC<{ children: ReactNode }> = ({
 	});
 
 	// ---------- Fetch helpers ----------
+	// list endpoints are paged: follow X-Next-Cursor until the last page
+	async function fetchAllPages(url: string): Promise<any[]> {
+		const rows: any[] = [];
+		let cursor: string | undefined;
+		do {
+			const res = await api.get(url, { params: cursor ? { cursor } : {} });
+			rows.push(...res.data);
+			cursor = res.headers["x-next-cursor"];
+		} while (cursor);
+		return rows;
+	}
+
 	async function fetchAllUsers() {
 		try {
 			const res = await api.get("/api/admin/users");
@@ -165,8 +177,8 @@ export const AppProvider: React.FC<{ children: ReactNode }> = ({
 
 	async function fetchAllAttendance() {
 		try {
-			const res = await api.get("/api/attendance");
-			const normalized = res.data.map((a: any) => normalizeAttendance(a));
+			const records = await fetchAllPages("/api/attendance");
+			const normalized = records.map((a: any) => normalizeAttendance(a));
 			setAttendanceRecords(normalized);
 		} catch (err) {
 			console.warn("fetch attendance failed", err);
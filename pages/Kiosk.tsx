@@ -238,16 +238,6 @@ const Kiosk: React.FC<KioskProps> = ({ onNavigate }) => {
 											});
 											break;
 
-										case "not_enrolled":
-											setResult({
-												status: "warning",
-												message:
-													"You are recognized, but not enrolled in this subject. Please contact faculty.",
-												studentName: res.name,
-												enrollmentNo: res.enrollment_no,
-											});
-											break;
-
 										case "no_face":
 											setResult({
 												status: "error",